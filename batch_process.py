@@ -0,0 +1,212 @@
+# batch_process.py
+"""
+Headless batch detection over a video file or a directory of images.
+
+    python batch_process.py recording.mp4 -o detections.jsonl
+    python batch_process.py frames/ -o detections.csv --detector multi-scale --workers 8
+
+Does not import Qt, so it starts quickly on servers without a display.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import MATCH_THRESHOLD, SCALE_PRUNING
+from object_detection import (detect_object, multi_scale_search, pyramid_multi_scale_detection,
+                              rotation_banks, rotation_invariant_detection)
+from frame_recorder import FrameReplay, is_recording
+from template_registry import CompiledTemplate, get_template
+from tracking import AdaptiveScaleDetector
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+OUTPUT_FIELDS = ['frame', 'source', 'detected', 'x1', 'y1', 'x2', 'y2', 'score', 'scale', 'angle', 'latency_ms']
+
+# Per-worker state, set up once by init_worker
+_template = None
+_detector = None
+_threshold = None
+_adaptive = None
+_prune = False
+
+
+def iter_frames(path, max_frames=None):
+    """
+    Yield (index, source, item) for each frame. `item` is a decoded frame for
+    videos and recordings and a file path for image directories, so workers
+    decode images themselves.
+    """
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names[:max_frames]):
+            yield index, name, os.path.join(path, name)
+        return
+
+    cap = FrameReplay(path) if is_recording(path) else cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {path}")
+    try:
+        index = 0
+        while max_frames is None or index < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield index, str(index), frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def init_worker(template_path, detector, threshold, prune=False):
+    global _template, _detector, _threshold, _adaptive, _prune
+    if template_path:
+        image = cv2.imread(template_path)
+        if image is None:
+            raise IOError(f"Cannot read template: {template_path}")
+        _template = CompiledTemplate(os.path.splitext(os.path.basename(template_path))[0], image)
+    else:
+        _template = get_template()
+        if _template is None:
+            raise IOError("No template found; capture one or pass --template")
+    _detector = detector
+    _threshold = threshold
+    _prune = prune
+    if detector == 'rotation':
+        rotation_banks(_template)
+    elif detector == 'adaptive':
+        # Each worker learns the scale from the frames it is given
+        _adaptive = AdaptiveScaleDetector(_template, threshold, prune=prune)
+
+
+def process_frame(index, source, item):
+    """Detect in one frame; returns (index, source, detection_result, latency, scales_matched, scales_pruned)."""
+    frame = cv2.imread(item) if isinstance(item, str) else item
+    if frame is None:
+        return index, source, None, 0.0, 0, 0
+
+    start = time.perf_counter()
+    evaluated = pruned = 0
+    if _detector == 'multi-scale':
+        detection_result, evaluated, pruned = multi_scale_search(frame, _threshold, template=_template, prune=_prune)
+    elif _detector == 'pyramid':
+        detection_result = pyramid_multi_scale_detection(frame, _threshold, template=_template)
+    elif _detector == 'rotation':
+        detection_result = rotation_invariant_detection(frame, _threshold, template=_template)
+    elif _detector == 'adaptive':
+        before = (_adaptive.scales_evaluated, _adaptive.scales_pruned)
+        detection_result = _adaptive.detect(frame)
+        evaluated, pruned = _adaptive.scales_evaluated - before[0], _adaptive.scales_pruned - before[1]
+    else:
+        detection_result = detect_object(frame, _template)
+        if detection_result is not None and detection_result[2] < _threshold:
+            detection_result = None
+    return index, source, detection_result, time.perf_counter() - start, evaluated, pruned
+
+
+def to_record(index, source, detection_result, latency):
+    record = {'frame': index, 'source': source, 'detected': detection_result is not None,
+              'x1': None, 'y1': None, 'x2': None, 'y2': None, 'score': None, 'scale': None, 'angle': None,
+              'latency_ms': round(latency * 1000, 3)}
+    if detection_result is not None:
+        (x1, y1), (x2, y2), score = detection_result[:3]
+        record.update(x1=int(x1), y1=int(y1), x2=int(x2), y2=int(y2), score=float(score))
+        if len(detection_result) > 3:
+            record['scale'] = float(detection_result[3])
+        if len(detection_result) > 4:
+            record['angle'] = float(detection_result[4])
+    return record
+
+
+class RecordWriter:
+    """Writes detection records as JSON Lines or CSV depending on the file extension."""
+
+    def __init__(self, path, fmt=None):
+        self.format = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.file = open(path, 'w', newline='') if path != '-' else sys.stdout
+        self.csv_writer = None
+        if self.format == 'csv':
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, record):
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def run(args):
+    workers = args.workers or os.cpu_count() or 1
+    writer = RecordWriter(args.output, args.format)
+    latencies = []
+    detected = 0
+    scales = [0, 0]  # Matched, pruned
+
+    def collect(future):
+        nonlocal detected
+        *result, evaluated, pruned = future.result()
+        record = to_record(*result)
+        latencies.append(record['latency_ms'])
+        detected += record['detected']
+        scales[0] += evaluated
+        scales[1] += pruned
+        writer.write(record)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(args.template, args.detector, args.threshold, args.prune)) as pool:
+        # Keep a bounded number of frames in flight and write results in frame order
+        pending = deque()
+        for index, source, item in iter_frames(args.input, args.max_frames):
+            pending.append(pool.submit(process_frame, index, source, item))
+            while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    elapsed = time.perf_counter() - start
+    writer.close()
+
+    frames = len(latencies)
+    if frames == 0:
+        print("No frames processed", file=sys.stderr)
+        return 1
+
+    print(f"Frames: {frames}, detected: {detected}, workers: {workers}", file=sys.stderr)
+    print(f"Throughput: {frames / elapsed:.1f} frames/s ({elapsed:.2f} s total)", file=sys.stderr)
+    print(f"Latency: p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms",
+          file=sys.stderr)
+    if args.detector in ('multi-scale', 'adaptive'):
+        print(f"Scales per frame: {scales[0] / frames:.1f} matched, {scales[1] / frames:.1f} pruned", file=sys.stderr)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run template detection over a video file or image directory.")
+    parser.add_argument('input', help="Video file, frame recording or directory of images")
+    parser.add_argument('-o', '--output', default='-', help="Output file (.jsonl or .csv); '-' for stdout")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Output format (default: from extension)")
+    parser.add_argument('--template', help="Template image (default: the saved template)")
+    parser.add_argument('--detector', choices=['object', 'multi-scale', 'pyramid', 'adaptive', 'rotation'],
+                        default='object')
+    parser.add_argument('--prune', action=argparse.BooleanOptionalAction, default=SCALE_PRUNING,
+                        help="Pruned scale search for multi-scale and adaptive (faster, may miss weak matches)")
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD)
+    parser.add_argument('--workers', type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-frames', type=int, help="Stop after this many frames")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
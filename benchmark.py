@@ -0,0 +1,250 @@
+# benchmark.py
+"""
+Reproducible benchmark of the detection functions on synthetic frames.
+
+    python benchmark.py -o bench.json
+    python benchmark.py --resolutions 480p 1080p --baseline bench_baseline.json
+
+Every frame is generated from a fixed seed with templates placed at known
+locations and scales. A timing only counts if the detector also finds the
+ground truth. With --baseline, results are compared with a previous run and
+the exit code is 1 on a slowdown beyond --tolerance or an accuracy regression.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from object_detection import (detect_object, multi_scale_detection, pyramid_multi_scale_detection,
+                              detect_multiple_objects, non_max_suppression_fast)
+from detection_engine import DetectionEngine
+from score_cache import score_cache
+from template_registry import CompiledTemplate
+from tracking import AdaptiveScaleDetector
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+DETECTORS = ['detect_object', 'multi_scale_detection', 'pyramid_multi_scale_detection',
+             'engine_multi_scale_detection', 'adaptive_multi_scale_detection', 'pruned_multi_scale_detection',
+             'detect_multiple_objects', 'non_max_suppression_fast']
+
+THRESHOLD = 0.8
+TRUE_SCALE = 1.2
+NMS_CANDIDATES = 100000
+
+# Started on first use by engine_multi_scale_detection, closed by main()
+_engine = None
+
+
+def textured(shape, rng, blur=7):
+    """Smooth random texture, so that every patch of it is distinctive."""
+    noise = rng.integers(0, 256, shape, dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (blur, blur), 0)
+
+
+def iou(box_a, box_b):
+    (ax1, ay1), (ax2, ay2) = box_a
+    (bx1, by1), (bx2, by2) = box_b
+    w = max(0, min(ax2, bx2) - max(ax1, bx1))
+    h = max(0, min(ay2, by2) - max(ay1, by1))
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - w * h
+    return w * h / union if union else 0.0
+
+
+class Scene:
+    """A synthetic frame with templates pasted at known boxes."""
+
+    def __init__(self, resolution, seed=0):
+        width, height = RESOLUTIONS[resolution]
+        rng = np.random.default_rng(seed)
+        self.frame = textured((height, width, 3), rng)
+
+        size = max(48, min(width, height) // 8)
+        self.template_image = textured((size, size, 3), rng)
+        self.template = CompiledTemplate('benchmark', self.template_image)
+        # Learns the scale over the warm-up runs, as it would over a camera's first frames
+        self.adaptive = AdaptiveScaleDetector(self.template, THRESHOLD)
+
+        # One copy at scale 1.0 per quadrant and one scaled copy in the centre
+        self.boxes = []
+        for fx, fy in ((0.1, 0.1), (0.6, 0.1), (0.1, 0.6), (0.6, 0.6)):
+            self.boxes.append(self._paste(self.template_image, int(width * fx), int(height * fy)))
+
+        scaled = cv2.resize(self.template_image, None, fx=TRUE_SCALE, fy=TRUE_SCALE, interpolation=cv2.INTER_AREA)
+        self.scaled_box = self._paste(scaled, (width - scaled.shape[1]) // 2, (height - scaled.shape[0]) // 2)
+
+        # Clusters of raw candidate boxes around known centres for the NMS benchmark
+        count = NMS_CANDIDATES // len(self.boxes)
+        boxes, scores = [], []
+        for (x1, y1), (x2, y2) in self.boxes:
+            jitter = rng.integers(-size // 8, size // 8 + 1, (count, 2))
+            boxes.append(np.hstack([jitter + (x1, y1), jitter + (x2, y2)]))
+            scores.append(1.0 - np.abs(jitter).sum(axis=1) / size)
+        self.nms_boxes = np.vstack(boxes)
+        self.nms_scores = np.concatenate(scores)
+
+    def _paste(self, image, x, y):
+        h, w = image.shape[:2]
+        self.frame[y:y + h, x:x + w] = image
+        return (x, y), (x + w, y + h)
+
+
+def run_detector(name, scene):
+    """Run one detector on a scene and return (output, correct)."""
+    if name == 'detect_object':
+        result = detect_object(scene.frame, scene.template)
+        correct = result is not None and any(iou(result[:2], box) > 0.9 for box in scene.boxes)
+    elif name in ('multi_scale_detection', 'pyramid_multi_scale_detection', 'engine_multi_scale_detection',
+                  'adaptive_multi_scale_detection', 'pruned_multi_scale_detection'):
+        if name == 'pruned_multi_scale_detection':
+            detector = lambda frame, threshold, template: multi_scale_detection(frame, threshold, template=template,
+                                                                                prune=True)
+        elif name == 'adaptive_multi_scale_detection':
+            detector = lambda frame, threshold, template: scene.adaptive.detect(frame)
+        elif name == 'engine_multi_scale_detection':
+            global _engine
+            _engine = _engine or DetectionEngine()
+            detector = _engine.multi_scale_detection
+        else:
+            detector = multi_scale_detection if name == 'multi_scale_detection' else pyramid_multi_scale_detection
+        result = detector(scene.frame, THRESHOLD, template=scene.template)
+        correct = result is not None and any(iou(result[:2], box) > 0.8
+                                             for box in scene.boxes + [scene.scaled_box])
+    elif name == 'detect_multiple_objects':
+        result = detect_multiple_objects(scene.frame, THRESHOLD, max_detections=len(scene.boxes),
+                                         template=scene.template)
+        correct = result is not None and len(result) == len(scene.boxes) and all(
+            any(iou(found[:2], box) > 0.9 for found in result) for box in scene.boxes)
+    elif name == 'non_max_suppression_fast':
+        boxes, _ = non_max_suppression_fast(scene.nms_boxes, scene.nms_scores, 0.3)
+        result = boxes
+        found = [((x1, y1), (x2, y2)) for x1, y1, x2, y2 in boxes.tolist()]
+        correct = len(found) == len(scene.boxes) and all(
+            any(iou(box, truth) > 0.9 for box in found) for truth in scene.boxes)
+    else:
+        raise ValueError(f"Unknown detector: {name}")
+    return result, correct
+
+
+def benchmark(name, scene, runs, warmup):
+    for _ in range(warmup):
+        run_detector(name, scene)
+
+    latencies = []
+    correct = True
+    for _ in range(runs):
+        start = time.perf_counter()
+        _, ok = run_detector(name, scene)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct = correct and ok
+
+    # Peak memory of a separate run, so that tracing does not skew the timings
+    tracemalloc.start()
+    run_detector(name, scene)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    return {
+        'runs': runs,
+        'fps': float(1000 / latencies.mean()),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'peak_mem_mb': peak / 2 ** 20,
+        'correct': bool(correct),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison with a baseline run and return the list of regressions."""
+    regressions = []
+    for resolution, detectors in results['results'].items():
+        for name, current in detectors.items():
+            previous = baseline.get('results', {}).get(resolution, {}).get(name)
+            if previous is None:
+                continue
+            ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1.0
+            status = 'ok'
+            if previous['correct'] and not current['correct']:
+                status = 'ACCURACY REGRESSION'
+            elif ratio > 1 + tolerance:
+                status = 'SLOWER'
+            if status != 'ok':
+                regressions.append((resolution, name, status))
+            print(f"{resolution:>6} {name:<30} {previous['p50_ms']:9.2f} -> {current['p50_ms']:9.2f} ms "
+                  f"({ratio:5.2f}x) {status}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection functions on synthetic frames.")
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument('--detectors', nargs='+', choices=DETECTORS, default=DETECTORS)
+    parser.add_argument('--runs', type=int, default=10, help="Timed runs per detector")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed warm-up runs per detector")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a previous results file")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed p50 slowdown against the baseline (0.10 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Every run sees the same frame, so cached score maps would time the cache instead of the detector
+    score_cache.resize(0)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'runs': args.runs,
+            'warmup': args.warmup,
+        },
+        'results': {},
+    }
+
+    for resolution in args.resolutions:
+        scene = Scene(resolution, args.seed)
+        results['results'][resolution] = {}
+        for name in args.detectors:
+            stats = benchmark(name, scene, args.runs, args.warmup)
+            results['results'][resolution][name] = stats
+            print(f"{resolution:>6} {name:<30} {stats['fps']:8.1f} fps  p50 {stats['p50_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  peak {stats['peak_mem_mb']:7.1f} MB  "
+                  f"{'ok' if stats['correct'] else 'WRONG'}")
+
+    if _engine is not None:
+        _engine.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(not stats['correct'] for detectors in results['results'].values() for stats in detectors.values())
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print("\nComparison with baseline:")
+        failed = bool(compare(results, baseline, args.tolerance)) or failed
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
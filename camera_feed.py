@@ -1,24 +1,215 @@
+import os
+import threading
+import time
 import cv2
-from config import CAMERA_INDEX
+import numpy as np
+from config import CAMERA_INDEX, CAMERA_BUFFER_SIZE, CAMERA_READ_RETRIES, CAMERA_RETRY_DELAY
+from frame_recorder import FrameReplay, is_recording
+
+def parse_source(source):
+    """Turn a configured source into a VideoCapture argument: digit strings become device indices."""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return source
+
 
 class CameraFeed:
-    def __init__(self):
+    """
+    Wraps a cv2.VideoCapture. In threaded mode a background thread grabs
+    frames at sensor rate into a small ring of preallocated buffers and
+    read_frame() hands out the newest one ("latest frame wins").
+
+    `source` is a device index, a video file, a stream URL (e.g. rtsp://...) or
+    a FrameRecorder recording. Video files and recordings are played back at
+    their own frame rate unless `realtime` is False, and end when they run
+    out of frames. A failed grab from a device or stream is retried, and the
+    source is reopened after CAMERA_READ_RETRIES failures in a row.
+    """
+
+    def __init__(self, source=None, threaded=False, buffer_size=CAMERA_BUFFER_SIZE, realtime=True):
+        self.source = CAMERA_INDEX if source is None else parse_source(source)
+        self.realtime = realtime
         self.cap = None
+        self.threaded = threaded
+        # Three slots are the minimum: one being written, one published, one held by the reader
+        self.buffer_size = max(3, buffer_size)
+
+        self._thread = None
+        self._is_file = False
+        self._failures = 0
+        self._frame_interval = 0.0
+        self._running = False
+        self._cond = threading.Condition()
+        self._buffers = None
+        self._latest = -1
+        self._reading = -1
+        self._latest_id = 0
+        self._read_id = 0
+
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+        self.reopens = 0
+
+    def _open(self):
+        if is_recording(self.source):
+            return FrameReplay(self.source, realtime=self.realtime)
+        return cv2.VideoCapture(self.source)
 
     def start(self):
-        self.cap = cv2.VideoCapture(CAMERA_INDEX)
+        self.cap = self._open()
         if not self.cap.isOpened():
-            raise IOError("Cannot open webcam")
+            self.cap = None
+            raise IOError(f"Cannot open video source: {self.source}")
+        self._is_file = isinstance(self.cap, FrameReplay) or (isinstance(self.source, str)
+                                                              and os.path.isfile(self.source))
+        self._failures = 0
+
+        # Only local files need pacing; devices and streams deliver frames at their own rate
+        self._frame_interval = 0.0
+        if self.realtime and isinstance(self.cap, cv2.VideoCapture) and self._is_file:
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            self._frame_interval = 1.0 / fps if fps > 0 else 0.0
+
+        if self.threaded:
+            self._buffers = None
+            self._latest = self._reading = -1
+            self._latest_id = self._read_id = 0
+            self._running = True
+            self._thread = threading.Thread(target=self._capture_loop, name=f"CameraFeed-{self.source}", daemon=True)
+            self._thread.start()
+
+    def _next_slot(self):
+        # Never overwrite the newest published frame or the one the reader holds
+        for offset in range(1, len(self._buffers) + 1):
+            slot = (self._latest + offset) % len(self._buffers)
+            if slot != self._latest and slot != self._reading:
+                return slot
+
+    def _capture_loop(self):
+        next_frame = time.perf_counter()
+        while self._running:
+            if self._frame_interval:
+                next_frame += self._frame_interval
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            with self._cond:
+                slot = self._next_slot() if self._buffers is not None else None
+            buffer = self._buffers[slot] if slot is not None else None
+
+            ret, frame = self.cap.read(buffer)
+            if not ret:
+                if self._read_failed():
+                    break
+                time.sleep(CAMERA_RETRY_DELAY)
+                continue
+            self._failures = 0
+
+            with self._cond:
+                if buffer is None or frame is not buffer:
+                    # First frame or the resolution changed: (re)allocate the ring
+                    self._buffers = [np.empty_like(frame) for _ in range(self.buffer_size)]
+                    self._latest = self._reading = -1
+                    slot = 0
+                    self._buffers[slot][...] = frame
 
-    def read_frame(self):
+                if self._latest_id > self._read_id:
+                    self.frames_dropped += 1
+                self._latest = slot
+                self._latest_id += 1
+                self.frames_captured += 1
+                self._cond.notify_all()
+
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def read_frame(self, timeout=None, copy=True):
+        """
+        Return the next frame, or None if there is none.
+
+        In threaded mode this never blocks unless `timeout` (seconds) is given,
+        and returns None when no frame newer than the last one read is ready.
+        With copy=False the returned array is a ring buffer slot that stays
+        valid until the next call to read_frame.
+        """
         if self.cap is None:
             return None
-        ret, frame = self.cap.read()
-        if not ret:
-            return None
-        return frame
+
+        if not self.threaded:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self._read_failed():
+                    self.cap.release()
+                    self.cap = None
+                elif timeout:
+                    time.sleep(min(timeout, CAMERA_RETRY_DELAY))
+                return None
+            self._failures = 0
+            self.frames_captured += 1
+            return frame
+
+        with self._cond:
+            if self._latest_id == self._read_id and timeout:
+                self._cond.wait_for(lambda: self._latest_id != self._read_id or not self._running, timeout)
+            if self._latest_id == self._read_id:
+                return None
+            self._read_id = self._latest_id
+            self._reading = self._latest
+            frame = self._buffers[self._reading]
+
+        return frame.copy() if copy else frame
+
+    def _read_failed(self):
+        """
+        Handle a failed grab. Returns True at the end of a video file or
+        recording; a device or stream is reopened after too many failures.
+        """
+        if self._is_file:
+            return True
+        self.read_failures += 1
+        self._failures += 1
+        if self._failures >= CAMERA_READ_RETRIES:
+            self._failures = 0
+            self.cap.release()
+            cap = self._open()
+            if cap.isOpened():
+                self.reopens += 1
+            self.cap = cap
+        return False
+
+    def peek_frame(self):
+        """
+        Copy of the newest frame in threaded mode, even if it was already read,
+        or None. Does not count as a read.
+        """
+        with self._cond:
+            if self._buffers is None or self._latest < 0:
+                return None
+            return self._buffers[self._latest].copy()
+
+    def is_running(self):
+        if self.threaded:
+            return self._running
+        return self.cap is not None
+
+    def stats(self):
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'read_failures': self.read_failures,
+            'reopens': self.reopens,
+        }
 
     def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+
         if self.cap is not None:
             self.cap.release()
             self.cap = None
@@ -0,0 +1,191 @@
+# camera_manager.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from camera_feed import CameraFeed
+from config import CAMERA_SOURCES, CAMERA_DETECTION_WORKERS, MATCH_THRESHOLD
+from motion_gate import MotionGate
+from pipeline import RateMeter
+from template_registry import get_template
+from tracking import TrackingDetector
+
+
+def default_detector_factory(template, threshold):
+    """
+    Per-camera detector: tracking search behind a motion gate, each with its
+    own state. The factory's set_threshold() updates every detector it made.
+    """
+    trackers = []
+
+    def factory(source):
+        tracker = TrackingDetector(template, threshold)
+        trackers.append(tracker)
+        return MotionGate(tracker.detect, tracker.detect_region, template.shape).detect
+
+    def set_threshold(value):
+        for tracker in trackers:
+            tracker.threshold = value
+
+    factory.set_threshold = set_threshold
+    return factory
+
+
+class CameraChannel:
+    """
+    One camera of a CameraManager. A capture thread (inside CameraFeed) grabs
+    frames; the channel thread hands the newest one to the shared detection pool
+    and keeps the latest (frame, detection_result) for display. Frames that
+    arrive while a detection is in flight are dropped, so a slow camera never
+    queues work. With an `event_log` every new detection at or above
+    `threshold` is logged under the channel's name.
+    """
+
+    def __init__(self, name, source, detector, executor, realtime=True, event_log=None, template_name=None,
+                 threshold=MATCH_THRESHOLD):
+        self.name = name
+        self.source = source
+        self.camera = CameraFeed(source, threaded=True, realtime=realtime)
+        self.detector = detector
+        self.executor = executor
+        self.event_log = event_log
+        self.template_name = template_name
+        self.threshold = threshold
+
+        self.detect_meter = RateMeter()
+        self.sequence = 0
+        self.error = None
+        self._latest = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self.camera.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"CameraChannel-{self.source}", daemon=True)
+        self._thread.start()
+
+    def _detect(self, frame):
+        start = time.perf_counter()
+        detection_result = self.detector(frame)
+        return detection_result, time.perf_counter() - start
+
+    def _run(self):
+        try:
+            while self._running:
+                frame = self.camera.read_frame(timeout=0.5)
+                if frame is None:
+                    if not self.camera.is_running():
+                        break
+                    continue
+                detection_result, elapsed = self.executor.submit(self._detect, frame).result()
+                self.detect_meter.tick(elapsed)
+                if self.event_log is not None:
+                    self.event_log.record_detection(detection_result, self.threshold, self.template_name, self.name)
+                with self._lock:
+                    self._latest = (frame, detection_result)
+                    self.sequence += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self._running = False
+
+    def latest(self):
+        """The newest (frame, detection_result, sequence), or None before the first detection."""
+        with self._lock:
+            if self._latest is None:
+                return None
+            return self._latest + (self.sequence,)
+
+    def is_running(self):
+        return self._running
+
+    def stats(self):
+        return {
+            'fps': self.detect_meter.rate,
+            'ms': self.detect_meter.mean_duration * 1000,
+            'frames_captured': self.camera.frames_captured,
+            'frames_dropped': self.camera.frames_dropped,
+            'detections': self.sequence,
+        }
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.camera.stop()
+
+
+class CameraManager:
+    """
+    Runs several cameras at once: one capture thread and one dispatch thread per
+    source, and a single detection pool sized to the CPU cores shared by all of
+    them. OpenCV releases the GIL while matching, so throughput scales with cores
+    until every camera is detecting at its frame rate.
+
+    `detector_factory(source)` returns the detection callable for one camera, so
+    that stateful detectors (tracking, motion gate) are kept per camera.
+    """
+
+    def __init__(self, sources=None, detector_factory=None, threshold=MATCH_THRESHOLD,
+                 workers=CAMERA_DETECTION_WORKERS, realtime=True, event_log=None, template_name=None):
+        self.sources = list(CAMERA_SOURCES if sources is None else sources)
+        if detector_factory is None:
+            template = get_template()
+            if template is None:
+                raise IOError("No template found; capture one first")
+            detector_factory = default_detector_factory(template, threshold)
+            template_name = template_name or template.name
+        self.detector_factory = detector_factory
+        self.threshold = threshold
+        self.event_log = event_log
+        self.template_name = template_name
+        self.workers = workers or os.cpu_count() or 1
+        self.realtime = realtime
+        self.executor = None
+        self.channels = []
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="camera-detect")
+        self.channels = [CameraChannel(f"Camera {index + 1}", source, self.detector_factory(source),
+                                       self.executor, self.realtime, self.event_log, self.template_name,
+                                       self.threshold)
+                         for index, source in enumerate(self.sources)]
+        started = []
+        try:
+            for channel in self.channels:
+                channel.start()
+                started.append(channel)
+        except IOError:
+            for channel in started:
+                channel.stop()
+            self.executor.shutdown()
+            self.executor = None
+            self.channels = []
+            raise
+
+    def set_threshold(self, value):
+        """Change the match threshold of running cameras, if their detectors support it."""
+        self.threshold = value
+        for channel in self.channels:
+            channel.threshold = value
+        set_threshold = getattr(self.detector_factory, 'set_threshold', None)
+        if set_threshold is not None:
+            set_threshold(value)
+
+    def is_running(self):
+        return any(channel.is_running() for channel in self.channels)
+
+    def stats(self):
+        return {channel.name: channel.stats() for channel in self.channels}
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
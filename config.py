@@ -1,14 +1,128 @@
 # config.py
 
-import cv2
-
 # Camera settings
 CAMERA_INDEX = 0  # Use 0 for default webcam
+CAMERA_THREADED = True  # Grab frames on a background thread
+CAMERA_BUFFER_SIZE = 3  # Number of preallocated frames in the capture ring
+CAMERA_READ_RETRIES = 20  # Consecutive failed grabs from a device or stream before it is reopened
+CAMERA_RETRY_DELAY = 0.05  # Seconds to wait after a failed grab from a device or stream
+# Sources for the multi-camera grid: device indices, video files or stream URLs (e.g. "rtsp://...").
+# With more than one source the main window shows a grid instead of the single camera view.
+CAMERA_SOURCES = []
+CAMERA_DETECTION_WORKERS = 0  # Detection threads shared by all cameras (0 = one per CPU core)
 
 # Template matching settings
-MATCH_METHOD = cv2.TM_CCOEFF_NORMED
+MATCH_METHOD = 'spatial'  # 'spatial' (cv2.matchTemplate), 'fft', or 'auto' to pick by template size
+FFT_AREA_RATIO = 0.15  # In 'auto' mode, templates covering at least this fraction of the frame use FFT
+FFT_SPECTRUM_CACHE = 4  # Template spectra kept per template; each is the size of the padded frame
+FFT_MATCH_TOLERANCE = 1e-4  # Max score difference between the FFT and spatial backends
 MATCH_THRESHOLD = 0.98  # Adjust this value based on your needs
 
+# Reduced-resolution detection (1.0 = match at full resolution, 0.5 = half, 0.25 = quarter)
+DETECTION_SCALE = 1.0
+DETECTION_REFINE = True  # Re-check a small full-resolution window around the reduced-resolution peak
+
+# Coarse-to-fine multi-scale search settings
+PYRAMID_LEVELS = 2  # Each level halves the frame before the coarse pass
+PYRAMID_CANDIDATES = 3  # Number of coarse hits refined at full resolution
+
+# Adaptive multi-scale search (AdaptiveScaleDetector): search only near the recently winning scales
+ADAPTIVE_SCALE_HISTORY = 3  # Most recent winning scales the band is built around
+ADAPTIVE_SCALE_REFINE = 4  # The narrow band steps this many times finer than the full sweep
+ADAPTIVE_SCALE_MARGIN = 1  # Fine steps added on each side of the learned scale band
+ADAPTIVE_SCALE_MAX_MISSES = 3  # Consecutive misses in the band before going back to the full sweep
+
+# Pruned multi-scale search: scales are tried outward from the last winner and skipped when they cannot win
+SCALE_PRUNING = False  # Use the pruned search in multi_scale_detection and AdaptiveScaleDetector
+SCALE_GOOD_ENOUGH = 0.99  # Stop at the first score this high
+SCALE_PRUNE_DOWNSAMPLE = 2  # Frame shrink factor of the cheap pre-match that estimates each scale's best score
+SCALE_PRUNE_SLACK = 0.2  # Added to the pre-match score to get the scale's upper bound; lower prunes more
+
+# Search area settings
+SEARCH_MODE = 'tracking'  # 'full' frame, saved 'roi' only, or 'tracking' around the last hit
+ROI_MARGIN = 40  # Pixels added around the saved ROI in 'roi' mode
+TRACKING_MARGIN = 32  # Pixels added around the last hit in 'tracking' mode
+TRACKING_MAX_MISSES = 5  # Consecutive misses before falling back to a full-frame scan
+
+# Motion gate: skip detection while the scene is static
+MOTION_GATE_ENABLED = True
+MOTION_THRESHOLD = 4.0  # Change (gray levels) of any thumbnail pixel that counts as motion
+MOTION_SIGNATURE_WIDTH = 80  # Width of the thumbnail compared between frames
+MOTION_TILES = (4, 4)  # Rows and columns of tiles the thumbnail is split into
+MOTION_TILE_RECHECK = True  # Re-run detection only around the changed tiles
+MOTION_MAX_SKIP = 30  # Force a full detection after this many skipped frames
+
+# Rotation-tolerant matching settings
+ROTATION_MATCHING = False  # Also search rotated copies of the template (for parts that arrive rotated)
+# A rotated part is resampled in the image, so it scores about 0.94-0.99 even at its exact angle, against ~1.0
+# upright: with rotation matching lower MATCH_THRESHOLD (and --threshold in batch_process.py) to about 0.93
+ROTATION_RANGE = (-30, 30)  # Angles searched, in degrees
+ROTATION_COARSE_STEP = 10  # Angle step of the coarse pass
+ROTATION_FINE_STEP = 2  # Angle step when refining a coarse candidate
+ROTATION_SCALE_RANGE = (0.9, 1.1)  # Scales searched together with the angles
+ROTATION_SCALE_STEPS = 3  # Scales in the coarse pass; the fine pass adds the midpoints
+ROTATION_DOWNSAMPLE = 2  # Frame shrink factor for the coarse pass
+ROTATION_CANDIDATES = 3  # Coarse (angle, scale, location) candidates refined at full resolution
+ROTATION_REFINE_ROUNDS = 3  # Halvings of the fine angle and scale steps tried around the best match (0 = off)
+
+# Detection backend settings
+DETECTION_BACKEND = 'template'  # 'template' (correlation matching) or 'features' (ORB keypoints + homography)
+# With 'features' the score is the fraction of keypoint matches that are RANSAC inliers, reported as is. True
+# detections score about 0.9, so lower MATCH_THRESHOLD (the slider) to about 0.85 for feature templates
+TEMPLATE_BACKENDS = {}  # Per-template overrides, e.g. {'bracket': 'features'}
+FEATURE_TEMPLATE_KEYPOINTS = 500  # ORB keypoints kept per template
+FEATURE_FRAME_KEYPOINTS = 1500  # ORB keypoints kept per frame
+FEATURE_MATCHER = 'bf'  # 'bf' (brute-force Hamming) or 'flann' (LSH index)
+FEATURE_RATIO = 0.75  # Lowe ratio test for keypoint matches
+FEATURE_MIN_INLIERS = 10  # RANSAC inliers needed to accept a detection
+FEATURE_THRESHOLD = 0.6  # Inlier fraction below which the feature backend reports no detection at all
+FEATURE_RANSAC_THRESHOLD = 5.0  # Reprojection error in pixels for a RANSAC inlier
+
+# Score map cache: repeated frames (replays of a recording) reuse their matchTemplate output.
+# Off by default: it costs a CRC32 per frame, and live cameras rarely repeat a frame.
+SCORE_CACHE_MB = 0  # Size limit of the cache in megabytes (0 = off)
+
+# Number of threads used to match many templates per frame (0 = one per CPU core)
+DETECTION_WORKERS = 0
+
+# Process-pool detection engine (detection_engine.py): frames are handed to the workers through shared memory
+ENGINE_WORKERS = 0  # Worker processes (0 = one per CPU core)
+ENGINE_SLOTS = 4  # Shared-memory frame slots, i.e. frames in flight at once
+ENGINE_TEMPLATES = 64  # Compiled templates each worker keeps; the least recently used are dropped
+
+# Detection pipeline settings
+DETECTION_PIPELINE = True  # Run capture/detect/render on worker threads instead of a GUI timer
+PIPELINE_QUEUE_SIZE = 2  # Frames buffered between stages before the oldest is dropped
+
+# Profiling settings
+STARTUP_REPORT = False  # Print a startup timing report to stderr (also: python main.py --startup-report)
+PROFILING_ENABLED = True  # Per-stage timers; cheap enough to leave on
+PROFILING_WINDOW = 10.0  # Seconds covered by the rolling latency histograms
+PERFORMANCE_OVERLAY = False  # Draw per-stage FPS/latency on the video
+METRICS_PORT = 0  # Serve stats as JSON on http://127.0.0.1:<port>/metrics (0 = off)
+PROFILING_DUMP_FILE = None  # Write stats to this JSON file when detection stops
+
+# Frame recorder settings
+RECORDER_FILE = None  # e.g. "recording.frames" to record raw frames and detection results while detecting
+RECORDER_CAPACITY = 300  # Frames kept in the ring; the file holds this many raw frames
+
+# Object counting settings
+COUNT_DB_FILE = "object_count.db"  # SQLite log of count events
+COUNT_HYSTERESIS = 0.05  # Score must drop this far below the threshold before the next count
+COUNT_FLUSH_INTERVAL = 1.0  # Seconds between batched writes
+COUNT_BATCH_SIZE = 100  # Events per write transaction at most
+COUNT_QUEUE_SIZE = 10000  # Count events waiting to be written; further events are dropped and counted
+SHIFTS = [("A", 6, 14), ("B", 14, 22), ("C", 22, 6)]  # (name, start hour, end hour)
+
+# Detection event log settings
+EVENT_LOG_DIR = None  # e.g. "events" to log every detection into rotating SQLite files in that directory
+EVENT_LOG_ROTATE = 3600  # Seconds covered by each file
+EVENT_LOG_KEEP = 168  # Newest files kept; older ones are deleted (0 = keep all)
+EVENT_LOG_QUEUE_SIZE = 10000  # Events waiting to be written; further events are dropped and counted
+EVENT_LOG_FLUSH_INTERVAL = 1.0  # Seconds between batched writes
+EVENT_LOG_BATCH_SIZE = 500  # Events per write transaction at most
+EVENT_LOG_PORT = 0  # Serve events as JSON on http://127.0.0.1:<port>/events and /aggregates (0 = off)
+
 # Visualization settings
 BOUNDING_BOX_COLOR = (0, 255, 0)  # Green
 BOUNDING_BOX_THICKNESS = 2
@@ -0,0 +1,410 @@
+# detection_engine.py
+"""
+Process-pool detection engine for the heavy searches.
+
+The parent converts each frame to grayscale straight into a shared-memory
+slot, so frames reach the workers without pickling or copying. Every worker
+process owns a fixed slice of the search space (every N-th scale of a
+multi-scale sweep, every N-th template of a library match) and keeps its
+compiled templates and pyramids between frames. The parent merges the partial
+results into the same shapes multi_scale_detection and detect_many return.
+
+    engine = DetectionEngine()
+    detection_result = engine.multi_scale_detection(frame, 0.8)
+    engine.close()
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from config import ENGINE_WORKERS, ENGINE_SLOTS, ENGINE_TEMPLATES
+from object_detection import (FrameContext, feature_detection, match_best, match_template, resolve_template,
+                              template_backend)
+from template_registry import CompiledTemplate, get_template, get_library
+
+
+def _best_level(context, template, levels, threshold):
+    """Best (score, order, top_left, bottom_right, scale) over some pyramid levels, as multi_scale_detection picks it."""
+    frame_gray = context.gray
+    best = None
+    for order, level in levels:
+        h, w = level.gray.shape[:2]
+        if h > frame_gray.shape[0] or w > frame_gray.shape[1]:
+            continue
+        _, max_val, _, max_loc = cv2.minMaxLoc(match_template(context, template, level))
+        if max_val >= threshold and (best is None or max_val > best[0]):
+            best = (max_val, order, max_loc, (max_loc[0] + w, max_loc[1] + h), level.scale)
+    return best
+
+
+def _match_one(context, template, threshold):
+    start = time.perf_counter()
+    if template_backend(template) == 'features':
+        detection_result = feature_detection(context.frame, template, context)
+    else:
+        detection_result = match_best(context, template)
+    if detection_result is not None and threshold is not None and detection_result[2] < threshold:
+        detection_result = None
+    return detection_result, time.perf_counter() - start
+
+
+def _worker_main(index, count, tasks, results):
+    # One matching thread per process; the engine provides the parallelism
+    cv2.setNumThreads(1)
+    templates = {}
+    blocks = {}
+    block_shape = None
+
+    while True:
+        task = tasks.get()
+        kind = task[0]
+        if kind == 'stop':
+            break
+        if kind == 'template':
+            _, uid, name, image = task
+            templates[uid] = CompiledTemplate(name, image)
+            continue
+        if kind == 'forget':
+            templates.pop(task[1], None)
+            continue
+
+        _, job_id, slot_name, shape, payload = task
+        try:
+            if shape != block_shape:
+                # The parent has moved to a new frame size; let go of the old slots
+                for block in blocks.values():
+                    block.close()
+                blocks.clear()
+                block_shape = shape
+            block = blocks.get(slot_name)
+            if block is None:
+                block = blocks[slot_name] = shared_memory.SharedMemory(name=slot_name)
+            context = FrameContext(np.ndarray(shape, dtype=np.uint8, buffer=block.buf))
+
+            if kind == 'multi_scale':
+                uid, scale_range, scale_steps, threshold = payload
+                template = templates[uid]
+                levels = list(enumerate(template.pyramid(scale_range, scale_steps)))[index::count]
+                output = _best_level(context, template, levels, threshold)
+            else:
+                uids, threshold = payload
+                output = {uid: _match_one(context, templates[uid], threshold) for uid in uids[index::count]}
+            del context
+            results.put((job_id, index, output, None))
+        except Exception as e:
+            results.put((job_id, index, None, repr(e)))
+
+    for block in blocks.values():
+        block.close()
+
+
+class _SlotPool:
+    """
+    Shared-memory frame slots for one grayscale frame shape. A retired pool
+    hands out no more slots and unlinks each one as soon as it is free, so
+    jobs still in flight keep their frame until they finish.
+    """
+
+    def __init__(self, shape, count):
+        self.shape = shape
+        size = max(1, int(np.prod(shape)))
+        self.live = [shared_memory.SharedMemory(create=True, size=size) for _ in range(count)]
+        self.free = list(self.live)
+        self.retired = False
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """A free slot, waiting if all are busy; None once the pool is retired."""
+        with self._condition:
+            while not self.free and not self.retired:
+                self._condition.wait()
+            if self.retired:
+                return None
+            return self.free.pop()
+
+    def release(self, slot):
+        with self._condition:
+            if self.retired:
+                self._unlink(slot)
+            else:
+                self.free.append(slot)
+                self._condition.notify()
+
+    def retire(self):
+        with self._condition:
+            self.retired = True
+            for slot in self.free:
+                self._unlink(slot)
+            self.free = []
+            self._condition.notify_all()
+
+    def close(self):
+        """Unlink every slot, including those of jobs that will never finish."""
+        self.retire()
+        with self._condition:
+            for slot in list(self.live):
+                self._unlink(slot)
+
+    def _unlink(self, slot):
+        if slot in self.live:
+            self.live.remove(slot)
+            slot.close()
+            slot.unlink()
+
+
+class _Job:
+    __slots__ = ('future', 'pool', 'slot', 'parts', 'pending', 'merge')
+
+    def __init__(self, pool, slot, pending, merge):
+        self.future = Future()
+        self.pool = pool
+        self.slot = slot
+        self.parts = {}
+        self.pending = pending
+        self.merge = merge
+
+
+class DetectionEngine:
+    """
+    Worker processes that share the work of one detection call. Up to `slots`
+    frames can be in flight at once; calls block while all slots are busy.
+    Workers keep the `templates` most recently used compiled templates, and a
+    reloaded template replaces the old copy of the same name. If a worker
+    process dies, pending and later calls fail instead of waiting forever.
+    """
+
+    def __init__(self, workers=ENGINE_WORKERS, slots=ENGINE_SLOTS, templates=ENGINE_TEMPLATES):
+        self.workers = workers or os.cpu_count() or 1
+        self.slot_count = max(1, slots)
+        self.template_count = max(1, templates)
+        self._pool = None
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._known_templates = OrderedDict()  # uid -> name, least recently used first
+        self._lock = threading.Lock()
+        self._broken = None
+        self._closing = False
+
+        # Workers must share the parent's resource tracker: one of their own would
+        # unlink the frame slots as soon as the worker exits
+        resource_tracker.ensure_running()
+
+        self._results = multiprocessing.Queue()
+        self._task_queues = []
+        self._processes = []
+        for index in range(self.workers):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_worker_main, args=(index, self.workers, tasks, self._results),
+                                              name=f"DetectionEngine-{index}", daemon=True)
+            process.start()
+            self._task_queues.append(tasks)
+            self._processes.append(process)
+
+        self._collector = threading.Thread(target=self._collect, name="DetectionEngine-results", daemon=True)
+        self._collector.start()
+
+    # Shared memory
+
+    def _load_frame(self, frame):
+        """Write the grayscale frame into a free slot and return (pool, slot)."""
+        shape = frame.shape[:2]
+        while True:
+            with self._lock:
+                if self._pool is None or self._pool.shape != shape:
+                    # Frames of the old size finish in the old slots, which are then unlinked
+                    if self._pool is not None:
+                        self._pool.retire()
+                    self._pool = _SlotPool(shape, self.slot_count)
+                pool = self._pool
+            slot = pool.acquire()
+            if slot is not None:
+                break
+        view = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+        if len(frame.shape) == 3:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=view)
+        else:
+            view[...] = frame
+        del view
+        return pool, slot
+
+    # Jobs
+
+    def _send_templates(self, templates):
+        """Make sure the workers hold `templates`; call under `_lock`, before queuing the job that uses them."""
+        needed = {template.uid for template in templates}
+        evicted = []
+        for template in templates:
+            if template.uid in self._known_templates:
+                self._known_templates.move_to_end(template.uid)
+                continue
+            # A reloaded template replaces the old compiled copy of the same name
+            if template.name is not None:
+                evicted += [uid for uid, name in self._known_templates.items()
+                            if name == template.name and uid not in needed]
+                for uid in evicted:
+                    self._known_templates.pop(uid, None)
+            self._known_templates[template.uid] = template.name
+            for tasks in self._task_queues:
+                tasks.put(('template', template.uid, template.name, template.image))
+
+        # Drop the least recently used, but never one this job needs
+        for uid in list(self._known_templates):
+            if len(self._known_templates) <= self.template_count:
+                break
+            if uid not in needed:
+                del self._known_templates[uid]
+                evicted.append(uid)
+        for uid in evicted:
+            for tasks in self._task_queues:
+                tasks.put(('forget', uid))
+
+    def _submit(self, kind, frame, payload, merge, templates):
+        if self._broken is not None:
+            raise self._broken
+        pool, slot = self._load_frame(frame)
+        with self._lock:
+            if self._broken is not None:
+                pool.release(slot)
+                raise self._broken
+            # Templates and the job are queued together, so no other call can evict them in between
+            self._send_templates(templates)
+            job_id = next(self._job_ids)
+            job = self._jobs[job_id] = _Job(pool, slot, self.workers, merge)
+            for tasks in self._task_queues:
+                tasks.put((kind, job_id, slot.name, frame.shape[:2], payload))
+        return job.future
+
+    def _fail_jobs(self, error):
+        """Fail every pending job, e.g. after a worker died; later calls fail at once."""
+        with self._lock:
+            self._broken = error
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            job.pool.release(job.slot)
+            job.future.set_exception(error)
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that crashed (or was killed) never posts its part
+                dead = [process for process in self._processes if not process.is_alive()]
+                if dead and not self._closing and self._broken is None:
+                    self._fail_jobs(RuntimeError(
+                        f"Detection worker {dead[0].name} died (exit code {dead[0].exitcode})"))
+                continue
+            if message is None:
+                break
+            job_id, index, output, error = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job.parts[index] = (output, error)
+                job.pending -= 1
+                if job.pending:
+                    continue
+                del self._jobs[job_id]
+            job.pool.release(job.slot)
+
+            errors = [error for _, error in job.parts.values() if error]
+            if errors:
+                job.future.set_exception(RuntimeError(f"Detection worker failed: {errors[0]}"))
+                continue
+            try:
+                result = job.merge([job.parts[i][0] for i in sorted(job.parts)])
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+
+    # Detectors
+
+    def submit_multi_scale(self, frame, threshold, scale_range=(0.5, 1.5), scale_steps=20, template=None):
+        """Start a multi-scale search; the Future resolves to what multi_scale_detection returns."""
+        template = resolve_template(template)
+        if template is None:
+            future = Future()
+            future.set_result(None)
+            return future
+
+        def merge(parts):
+            # Same winner as the serial loop: highest score, earliest scale on ties
+            found = [part for part in parts if part is not None]
+            if not found:
+                return None
+            max_val, _, top_left, bottom_right, scale = max(found, key=lambda part: (part[0], -part[1]))
+            return (top_left, bottom_right, max_val, scale)
+
+        payload = (template.uid, tuple(scale_range), int(scale_steps), threshold)
+        return self._submit('multi_scale', frame, payload, merge, [template])
+
+    def multi_scale_detection(self, frame, threshold, scale_range=(0.5, 1.5), scale_steps=20, template=None):
+        """multi_scale_detection with the scales split across the worker processes."""
+        return self.submit_multi_scale(frame, threshold, scale_range, scale_steps, template).result()
+
+    def submit_many(self, frame, templates=None, threshold=None):
+        """Start a library match; the Future resolves to what detect_many returns."""
+        start = time.perf_counter()
+        if templates is None:
+            templates = get_library()
+        templates = [get_template(t) if isinstance(t, str) else resolve_template(t) for t in templates]
+        templates = [t for t in templates if t is not None]
+        names = {template.uid: template.name for template in templates}
+
+        def merge(parts):
+            combined = {}
+            for part in parts:
+                combined.update(part)
+            detections, timings = {}, {}
+            for uid, name in names.items():
+                detections[name], timings[name] = combined[uid]
+            return {
+                'detections': detections,
+                'timings': timings,
+                'setup_time': setup_time,
+                'total_time': time.perf_counter() - start,
+            }
+
+        setup_time = time.perf_counter() - start
+        return self._submit('many', frame, (list(names), threshold), merge, templates)
+
+    def detect_many(self, frame, templates=None, threshold=None):
+        """detect_many with the templates split across the worker processes."""
+        return self.submit_many(frame, templates, threshold).result()
+
+    def close(self):
+        self._closing = True
+        for tasks in self._task_queues:
+            tasks.put(('stop',))
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        self._collector.join()
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+        self._processes = []
+        self._task_queues = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,364 @@
+# event_log.py
+"""
+Detection event log with a local query API.
+
+Every detection (timestamp, camera, template, box, score, scale, angle) is
+put on a bounded queue and written in batches by a background thread into
+SQLite files that rotate every `rotate_seconds`:
+
+    <directory>/events-20240131-140000.db
+
+The oldest files beyond `keep` are deleted. Queries open their own read-only
+connections, so serving them never waits on the capture or detect threads:
+
+    GET /events?limit=100&since=<unix time>&camera=Camera%201&template=part
+    GET /aggregates?since=<unix time>&until=<unix time>&bucket=60
+    GET /stats
+"""
+
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from config import (EVENT_LOG_DIR, EVENT_LOG_ROTATE, EVENT_LOG_KEEP, EVENT_LOG_QUEUE_SIZE,
+                    EVENT_LOG_FLUSH_INTERVAL, EVENT_LOG_BATCH_SIZE)
+
+FILE_PREFIX = 'events-'
+FILE_SUFFIX = '.db'
+FILE_TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+COLUMNS = ('timestamp', 'camera', 'template', 'x1', 'y1', 'x2', 'y2', 'score', 'scale', 'angle')
+
+
+class EventLog:
+    """
+    Asynchronous, rotating SQLite log of detection events. record() never
+    blocks: when the queue is full the event is dropped and counted in
+    `dropped`, so a slow disk cannot stall detection. Batches that cannot be
+    written (disk full, unreadable file) are counted in `failed` and the
+    error kept in `error`; the writer reopens the file and carries on.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            camera TEXT,
+            template TEXT,
+            x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+            score REAL,
+            scale REAL,
+            angle REAL
+        );
+        CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp);
+    """
+
+    def __init__(self, directory=EVENT_LOG_DIR, rotate_seconds=EVENT_LOG_ROTATE, keep=EVENT_LOG_KEEP,
+                 queue_size=EVENT_LOG_QUEUE_SIZE, flush_interval=EVENT_LOG_FLUSH_INTERVAL,
+                 batch_size=EVENT_LOG_BATCH_SIZE):
+        self.directory = directory
+        self.rotate_seconds = rotate_seconds
+        self.keep = keep
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_boxes = {}
+        self._server = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer_loop, name="EventLog", daemon=True)
+        self._thread.start()
+
+    # Files
+
+    def period_start(self, timestamp):
+        return timestamp - timestamp % self.rotate_seconds
+
+    def path_for(self, period_start):
+        name = time.strftime(FILE_TIME_FORMAT, time.localtime(period_start))
+        return os.path.join(self.directory, FILE_PREFIX + name + FILE_SUFFIX)
+
+    def files(self):
+        """Log files as a list of (period_start, path), oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)):
+                continue
+            stamp = name[len(FILE_PREFIX):-len(FILE_SUFFIX)]
+            try:
+                start = time.mktime(time.strptime(stamp, FILE_TIME_FORMAT))
+            except ValueError:
+                continue
+            found.append((start, os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _open(self, period_start):
+        connection = sqlite3.connect(self.path_for(period_start))
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self.SCHEMA)
+        connection.commit()
+        return connection
+
+    def _expire(self):
+        if not self.keep:
+            return
+        for _, path in self.files()[:-self.keep]:
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    # Writing
+
+    def record(self, detection_result, template=None, camera=None, timestamp=None):
+        """Queue one detection; results of None are ignored."""
+        if detection_result is None:
+            return
+        (x1, y1), (x2, y2), score = detection_result[:3]
+        scale = detection_result[3] if len(detection_result) > 3 else 1.0
+        angle = detection_result[4] if len(detection_result) > 4 else 0.0
+        event = (time.time() if timestamp is None else timestamp, camera, template,
+                 int(x1), int(y1), int(x2), int(y2), float(score), float(scale), float(angle))
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_detection(self, detection_result, threshold, template=None, camera=None, timestamp=None):
+        """
+        Queue a detection only when it is a new one: results below `threshold`
+        are skipped, and so is a result with the same box as the last one logged
+        for this camera and template (the motion gate hands the previous result
+        back while the scene is still) until the part has gone.
+        """
+        key = (camera, template)
+        if detection_result is None or detection_result[2] < threshold:
+            self._last_boxes.pop(key, None)
+            return
+        box = (*detection_result[0], *detection_result[1])
+        if self._last_boxes.get(key) == box:
+            return
+        self._last_boxes[key] = box
+        self.record(detection_result, template, camera, timestamp)
+
+    def _writer_loop(self):
+        connection = None
+        period = None
+        running = True
+        while running:
+            batch = []
+            marker = None
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    # flush() marker: commit what we have, then wake the caller
+                    marker = item
+                    break
+                batch.append(item)
+
+            # Split the batch at period boundaries, each part into its own file
+            start = 0
+            while start < len(batch):
+                batch_period = self.period_start(batch[start][0])
+                end = start
+                while end < len(batch) and self.period_start(batch[end][0]) == batch_period:
+                    end += 1
+                try:
+                    if batch_period != period:
+                        if connection is not None:
+                            connection.close()
+                        connection, period = None, None
+                        connection, period = self._open(batch_period), batch_period
+                        self._expire()
+                    with connection:
+                        connection.executemany(
+                            f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                            batch[start:end])
+                    self.written += end - start
+                except (sqlite3.Error, OSError) as e:
+                    # Drop this part and reopen the file for the next one
+                    self.failed += end - start
+                    self.error = e
+                    if connection is not None:
+                        connection.close()
+                    connection, period = None, None
+                start = end
+
+            if marker is not None:
+                marker.set()
+        if connection is not None:
+            connection.close()
+
+    def flush(self, timeout=5.0):
+        """Block until every queued event is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    # Queries
+
+    def _read(self, since=None, until=None):
+        """Read-only connections to the files that may hold events in [since, until], newest first."""
+        for start, path in reversed(self.files()):
+            if since is not None and start + self.rotate_seconds <= since:
+                break
+            if until is not None and start > until:
+                continue
+            try:
+                connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            except sqlite3.OperationalError:
+                continue
+            try:
+                yield connection
+            finally:
+                connection.close()
+
+    @staticmethod
+    def _where(since=None, until=None, camera=None, template=None):
+        clauses, params = [], []
+        for clause, value in (("timestamp >= ?", since), ("timestamp <= ?", until),
+                              ("camera = ?", camera), ("template = ?", template)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def recent(self, limit=100, since=None, camera=None, template=None):
+        """Committed events as dicts, newest first."""
+        where, params = self._where(since, None, camera, template)
+        events = []
+        for connection in self._read(since):
+            rows = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM events{where} ORDER BY timestamp DESC LIMIT ?",
+                params + [limit - len(events)]).fetchall()
+            events.extend(dict(zip(COLUMNS, row)) for row in rows)
+            if len(events) >= limit:
+                break
+        return events
+
+    def aggregates(self, since=None, until=None, bucket=None):
+        """
+        Event counts and scores per camera and template, optionally per time
+        bucket of `bucket` seconds, as a list of dicts sorted by bucket.
+        """
+        if bucket is not None and not (math.isfinite(bucket) and bucket > 0):
+            raise ValueError(f"bucket must be a positive number of seconds, not {bucket}")
+        where, params = self._where(since, until)
+        bucket_column = f"CAST(timestamp / {float(bucket)} AS INTEGER) * {float(bucket)}" if bucket else "NULL"
+        groups = {}
+        for connection in self._read(since, until):
+            rows = connection.execute(
+                f"SELECT {bucket_column}, camera, template, COUNT(*), SUM(score), MAX(score), "
+                f"MIN(timestamp), MAX(timestamp) FROM events{where} GROUP BY 1, camera, template",
+                params).fetchall()
+            for bucket_start, camera, template, count, score_sum, score_max, first, last in rows:
+                group = groups.get((bucket_start, camera, template))
+                if group is None:
+                    groups[(bucket_start, camera, template)] = [count, score_sum, score_max, first, last]
+                else:
+                    group[0] += count
+                    group[1] += score_sum
+                    group[2] = max(group[2], score_max)
+                    group[3] = min(group[3], first)
+                    group[4] = max(group[4], last)
+
+        result = []
+        for (bucket_start, camera, template), (count, score_sum, score_max, first, last) in groups.items():
+            entry = {
+                'camera': camera,
+                'template': template,
+                'count': count,
+                'mean_score': score_sum / count,
+                'max_score': score_max,
+                'first': first,
+                'last': last,
+            }
+            if bucket:
+                entry['bucket'] = bucket_start
+            result.append(entry)
+        result.sort(key=lambda entry: (entry.get('bucket') or 0, entry['camera'] or '', entry['template'] or ''))
+        return result
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'error': repr(self.error) if self.error is not None else None,
+            'files': len(self.files()),
+        }
+
+    # HTTP
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /events, /aggregates and /stats as JSON on http://host:port from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlsplit, parse_qs
+        event_log = self
+
+        class EventHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    since = float(query['since']) if 'since' in query else None
+                    until = float(query['until']) if 'until' in query else None
+                    if url.path == '/events':
+                        body = event_log.recent(int(query.get('limit', 100)), since,
+                                                query.get('camera'), query.get('template'))
+                    elif url.path == '/aggregates':
+                        bucket = float(query['bucket']) if 'bucket' in query else None
+                        body = event_log.aggregates(since, until, bucket)
+                    elif url.path == '/stats':
+                        body = event_log.stats()
+                    else:
+                        self.send_error(404)
+                        return
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                except sqlite3.Error as e:
+                    self.send_error(500, str(e))
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), EventHandler)
+        threading.Thread(target=self._server.serve_forever, name="event-log-http", daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
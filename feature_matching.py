@@ -0,0 +1,94 @@
+# feature_matching.py
+"""
+ORB keypoint backend. A template's keypoints, descriptors and trained matcher
+are built once; each frame then costs one ORB pass plus a nearest-neighbour
+search over its keypoints, independent of the scale or rotation of the part.
+The template is located by a RANSAC homography, so the backend also copes
+with perspective change and partial occlusion.
+"""
+
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from config import (FEATURE_MATCHER, FEATURE_RATIO, FEATURE_MIN_INLIERS, FEATURE_RANSAC_THRESHOLD)
+
+# Keypoint coordinates as an (N, 2) float32 array plus the matching ORB descriptors
+Features = namedtuple('Features', ['points', 'descriptors'])
+
+FLANN_INDEX_LSH = 6
+
+# cv2.ORB objects keep per-call state, so each thread gets its own
+_local = threading.local()
+
+
+def _orb(nfeatures):
+    orbs = getattr(_local, 'orbs', None)
+    if orbs is None:
+        orbs = _local.orbs = {}
+    orb = orbs.get(nfeatures)
+    if orb is None:
+        orb = orbs[nfeatures] = cv2.ORB_create(nfeatures=nfeatures)
+    return orb
+
+
+def compute_features(gray, nfeatures):
+    """ORB keypoints and descriptors of a grayscale image."""
+    keypoints, descriptors = _orb(nfeatures).detectAndCompute(gray, None)
+    points = np.float32([keypoint.pt for keypoint in keypoints]).reshape(-1, 2)
+    return Features(points, descriptors)
+
+
+def create_matcher(descriptors, kind=FEATURE_MATCHER):
+    """
+    Matcher trained on a template's descriptors: brute-force Hamming ('bf') or
+    a FLANN LSH index ('flann'), which pays off for templates with many keypoints.
+    """
+    if kind == 'flann':
+        index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+        matcher = cv2.FlannBasedMatcher(index_params, dict(checks=50))
+    elif kind == 'bf':
+        matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    else:
+        raise ValueError(f"Unknown feature matcher: {kind}")
+    if descriptors is not None and len(descriptors):
+        matcher.add([descriptors])
+        matcher.train()
+    return matcher
+
+
+def match_features(frame_features, template_features, matcher, template_shape, ratio=FEATURE_RATIO,
+                   min_inliers=FEATURE_MIN_INLIERS, ransac_threshold=FEATURE_RANSAC_THRESHOLD):
+    """
+    Locate a template in a frame from their features.
+
+    Returns (homography, corners, inliers, matches), where `corners` are the
+    template corners projected into the frame, or None if too few matches
+    survive the ratio test and RANSAC, or the projected outline is not convex.
+    """
+    if (frame_features.descriptors is None or template_features.descriptors is None
+            or len(frame_features.points) < 2 or len(template_features.points) < 2):
+        return None
+
+    pairs = matcher.knnMatch(frame_features.descriptors, k=2)
+    good = [pair[0] for pair in pairs if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance]
+    if len(good) < max(4, min_inliers):
+        return None
+
+    source = template_features.points[[match.trainIdx for match in good]]
+    destination = frame_features.points[[match.queryIdx for match in good]]
+    homography, inlier_mask = cv2.findHomography(source, destination, cv2.RANSAC, ransac_threshold)
+    if homography is None:
+        return None
+    inliers = int(inlier_mask.sum())
+    if inliers < min_inliers:
+        return None
+
+    height, width = template_shape[:2]
+    outline = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    corners = cv2.perspectiveTransform(outline, homography).reshape(-1, 2)
+    if not cv2.isContourConvex(corners):
+        return None
+    return homography, corners, inliers, len(good)
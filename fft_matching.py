@@ -0,0 +1,75 @@
+# fft_matching.py
+
+import cv2
+import numpy as np
+
+# Windows whose intensity variance is below this are treated as flat and score 0
+FLAT_WINDOW_EPSILON = 1e-6
+
+
+def dft_size(frame_shape):
+    """Padded DFT size for a frame; correlations of valid positions never wrap around."""
+    height, width = frame_shape[:2]
+    return cv2.getOptimalDFTSize(height), cv2.getOptimalDFTSize(width)
+
+
+def frame_spectrum(frame_gray, size):
+    """Forward DFT (CCS packed) of a grayscale frame zero-padded to `size`."""
+    padded = np.zeros(size, np.float32)
+    padded[:frame_gray.shape[0], :frame_gray.shape[1]] = frame_gray
+    return cv2.dft(padded)
+
+
+def template_spectrum(template_gray, mean, size):
+    """Forward DFT of the zero-mean template zero-padded to `size`."""
+    padded = np.zeros(size, np.float32)
+    padded[:template_gray.shape[0], :template_gray.shape[1]] = template_gray
+    padded[:template_gray.shape[0], :template_gray.shape[1]] -= mean
+    return cv2.dft(padded, nonzeroRows=template_gray.shape[0])
+
+
+def frame_integrals(frame_gray):
+    """Integral images of the frame and of its squares, in float64."""
+    return cv2.integral2(frame_gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+
+def window_sums(integral, height, width):
+    """Sum over every height x width window, laid out like a matchTemplate result."""
+    return (integral[height:, width:] - integral[:-height, width:]
+            - integral[height:, :-width] + integral[:-height, :-width])
+
+
+def window_deviation(integrals, height, width):
+    """
+    Zero-mean L2 norm of every height x width window of the frame, laid out
+    like a matchTemplate result. Flat windows are set to 0.
+    """
+    integral, squared_integral = integrals
+    sums = window_sums(integral, height, width)
+    variance = window_sums(squared_integral, height, width) - sums * sums / (height * width)
+    variance[variance < FLAT_WINDOW_EPSILON * height * width] = 0
+    return np.sqrt(variance).astype(np.float32)
+
+
+def match_template_fft(spectrum, deviation, template_shape, template_norm, templ_spectrum):
+    """
+    Normalized cross-correlation (TM_CCOEFF_NORMED) computed in the frequency domain.
+
+    The numerator is the inverse DFT of the frame spectrum times the conjugate
+    of the cached zero-mean template spectrum; the denominator is the window
+    deviation from window_deviation() times the template norm. Scores agree
+    with cv2.matchTemplate to within FFT_MATCH_TOLERANCE (config.py), except
+    on flat windows, which score 0.
+    """
+    result_shape = deviation.shape
+    if template_norm <= 0:
+        return np.zeros(result_shape, np.float32)
+
+    product = cv2.mulSpectrums(spectrum, templ_spectrum, 0, conjB=True)
+    correlation = cv2.dft(product, flags=cv2.DFT_INVERSE | cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+    numerator = correlation[:result_shape[0], :result_shape[1]]
+
+    result = np.zeros(result_shape, np.float32)
+    np.divide(numerator, deviation * np.float32(template_norm), out=result, where=deviation > 0)
+    np.clip(result, -1.0, 1.0, out=result)
+    return result
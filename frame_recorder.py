@@ -0,0 +1,230 @@
+# frame_recorder.py
+"""
+Raw frame recorder and replay source.
+
+A recording is one preallocated, memory-mapped file laid out as
+
+    header | index[capacity] | frames[capacity]
+
+where the frames form a ring: once `capacity` frames have been written the
+oldest are overwritten, so a recorder can run for a whole shift and still hold
+the last few minutes before a false reject. Each index entry holds the frame's
+sequence number, timestamp and detection result. Frames are stored raw, so
+replay gives the detector exactly the pixels it saw.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from config import RECORDER_CAPACITY
+
+MAGIC = b'SRCHREC1'
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('capacity', '<u4'),
+    ('count', '<u8'),  # Frames written so far, including overwritten ones
+])
+HEADER_SIZE = 64
+
+INDEX_DTYPE = np.dtype([
+    ('sequence', '<i8'),
+    ('timestamp', '<f8'),
+    ('detected', 'u1'),
+    ('box', '<i4', (4,)),
+    ('score', '<f4'),
+    ('scale', '<f4'),
+    ('angle', '<f4'),
+])
+
+# Frames start on a page boundary so that each one maps cleanly
+PAGE_SIZE = 4096
+
+
+def _layout(height, width, channels, capacity):
+    frame_bytes = height * width * channels
+    frames_offset = HEADER_SIZE + INDEX_DTYPE.itemsize * capacity
+    frames_offset = (frames_offset + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+    return frames_offset, frames_offset + frame_bytes * capacity
+
+
+def recording_path(path, timestamp=None):
+    """
+    A new file name for a recording: `path` with the start time added, e.g.
+    recording.frames -> recording-20240131-140502.frames, never an existing file.
+    """
+    root, extension = os.path.splitext(path)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(time.time() if timestamp is None else timestamp))
+    candidate = f"{root}-{stamp}{extension}"
+    counter = 1
+    while os.path.exists(candidate):
+        counter += 1
+        candidate = f"{root}-{stamp}-{counter}{extension}"
+    return candidate
+
+
+def is_recording(path):
+    """True if `path` is a recording file made by FrameRecorder."""
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class FrameRecorder:
+    """
+    Appends frames and their detection results to a recording file. The file
+    is allocated in full when the recorder is created, so recording never
+    grows it, and a frame costs one memcpy into the mapping. An existing file
+    is never overwritten; use recording_path() for a fresh name.
+    """
+
+    def __init__(self, path, frame_shape, capacity=RECORDER_CAPACITY):
+        height, width = frame_shape[:2]
+        channels = frame_shape[2] if len(frame_shape) > 2 else 1
+        frames_offset, size = _layout(height, width, channels, capacity)
+
+        with open(path, 'xb') as f:
+            f.truncate(size)
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size,))
+
+        self.header = self._map[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        self.header['magic'] = MAGIC
+        self.header['height'], self.header['width'] = height, width
+        self.header['channels'], self.header['capacity'] = channels, capacity
+        self.header['count'] = 0
+
+        self.index = self._map[HEADER_SIZE:HEADER_SIZE + INDEX_DTYPE.itemsize * capacity].view(INDEX_DTYPE)
+        self.frames = self._map[frames_offset:size].reshape((capacity,) + tuple(frame_shape))
+        self.frame_shape = tuple(frame_shape)
+        self.capacity = capacity
+        self.count = 0
+
+    def record(self, frame, detection_result=None, timestamp=None):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the recording {self.frame_shape}")
+
+        slot = self.count % self.capacity
+        self.frames[slot] = frame
+
+        entry = self.index[slot]
+        entry['sequence'] = self.count
+        entry['timestamp'] = time.time() if timestamp is None else timestamp
+        entry['detected'] = detection_result is not None
+        if detection_result is None:
+            entry['box'] = 0
+            entry['score'] = entry['scale'] = entry['angle'] = 0.0
+        else:
+            (x1, y1), (x2, y2), score = detection_result[:3]
+            entry['box'] = (x1, y1, x2, y2)
+            entry['score'] = score
+            entry['scale'] = detection_result[3] if len(detection_result) > 3 else 1.0
+            entry['angle'] = detection_result[4] if len(detection_result) > 4 else 0.0
+
+        # Publish the frame only once it is complete
+        self.count += 1
+        self.header['count'] = self.count
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+            self.header = self.index = self.frames = None
+
+
+class FrameReplay:
+    """
+    Plays a recording back through the cv2.VideoCapture interface, so that
+    CameraFeed can open it in place of a device. read() returns zero-copy views
+    of the mapped file (copy-on-write, so drawing on them never touches the
+    recording). With `realtime` the frames are served at their recorded
+    timestamps, otherwise as fast as they are read.
+    """
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+
+        self._map = np.memmap(path, dtype=np.uint8, mode='c')
+        header = self._map[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header['magic'] != MAGIC:
+            raise IOError(f"Not a frame recording: {path}")
+
+        height, width = int(header['height']), int(header['width'])
+        channels, capacity = int(header['channels']), int(header['capacity'])
+        frames_offset, size = _layout(height, width, channels, capacity)
+        shape = (height, width, channels) if channels > 1 else (height, width)
+
+        self.index = self._map[HEADER_SIZE:HEADER_SIZE + INDEX_DTYPE.itemsize * capacity].view(INDEX_DTYPE)
+        self.frames = self._map[frames_offset:size].reshape((capacity,) + shape)
+
+        # Oldest frame first once the ring has wrapped
+        count = int(header['count'])
+        if count <= capacity:
+            self.order = np.arange(count)
+        else:
+            self.order = (np.arange(count - capacity, count) % capacity)
+
+        self.position = 0
+        self._start_time = None
+        self._start_timestamp = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def isOpened(self):
+        return self._map is not None
+
+    def get(self, prop):
+        return 0.0
+
+    def entry(self, position):
+        """Index entry (sequence, timestamp, detection result fields) of the frame at a replay position."""
+        return self.index[self.order[position]]
+
+    def detection_result(self, position):
+        """The detection result recorded with a frame, in the detectors' tuple form, or None."""
+        entry = self.entry(position)
+        if not entry['detected']:
+            return None
+        x1, y1, x2, y2 = (int(v) for v in entry['box'])
+        return ((x1, y1), (x2, y2), float(entry['score']), float(entry['scale']), float(entry['angle']))
+
+    def read(self, image=None):
+        if self._map is None or len(self.order) == 0:
+            return False, None
+        if self.position >= len(self.order):
+            if not self.loop:
+                return False, None
+            self.position = 0
+            self._start_time = None
+
+        slot = self.order[self.position]
+        if self.realtime:
+            timestamp = float(self.index[slot]['timestamp'])
+            if self._start_time is None:
+                self._start_time, self._start_timestamp = time.perf_counter(), timestamp
+            delay = (timestamp - self._start_timestamp) - (time.perf_counter() - self._start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+        self.position += 1
+        frame = self.frames[slot]
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            return True, image
+        return True, frame
+
+    def release(self):
+        self._map = None
+        self.index = self.frames = None
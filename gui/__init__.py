@@ -1,7 +1,21 @@
 # gui/__init__.py
 
-from .main_window import MainWindow
-from .template_capture_dialog import TemplateCaptureDialog
-from .result_display_widget import ResultDisplayWidget
+import importlib
 
-__all__ = ['MainWindow', 'TemplateCaptureDialog', 'ResultDisplayWidget']
+# Widgets are imported on first access, so that importing one of them does not
+# pull in cv2, the camera and the detectors along with all the others
+_MODULES = {
+    'MainWindow': '.main_window',
+    'TemplateCaptureDialog': '.template_capture_dialog',
+    'ResultDisplayWidget': '.result_display_widget',
+    'CameraGridWidget': '.camera_grid_widget',
+}
+
+__all__ = ['MainWindow', 'TemplateCaptureDialog', 'ResultDisplayWidget', 'CameraGridWidget']
+
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
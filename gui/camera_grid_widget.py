@@ -0,0 +1,117 @@
+import math
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QGridLayout, QLabel, QScrollArea
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from camera_manager import CameraManager
+from .result_display_widget import FrameView
+from visualization import visualize_result
+
+# Smallest tile size; with many cameras the grid scrolls instead of shrinking further
+MIN_TILE_SIZE = (320, 240)
+
+
+class CameraTile(QLabel):
+    """One camera of the grid. Keeps its own display buffers and the last sequence shown."""
+
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.shown_sequence = -1
+        self.frame_view = FrameView(self)
+        self.setAlignment(Qt.AlignCenter)
+        self.setMinimumSize(*MIN_TILE_SIZE)
+        self.setStyleSheet("background-color: black; color: white;")
+        self.setText(name)
+
+    def is_exposed(self):
+        return self.isVisible() and not self.visibleRegion().isEmpty()
+
+    def show_frame(self, frame):
+        self.frame_view.show(frame)
+
+
+class CameraGridWidget(QWidget):
+    """
+    Grid view of a CameraManager. Capture and detection run in the manager's
+    threads; the GUI timer only draws tiles that are on screen and have a new
+    result, so hidden or scrolled-away cameras cost no rendering.
+    """
+    stats_updated = pyqtSignal(dict)
+
+    def __init__(self, sources, event_log=None, parent=None):
+        super().__init__(parent)
+        self.sources = list(sources)
+        self.event_log = event_log
+        self.manager = None
+        self.threshold = None
+
+        self.layout = QVBoxLayout(self)
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setWidgetResizable(True)
+        self.layout.addWidget(self.scroll_area)
+
+        grid_container = QWidget()
+        self.grid = QGridLayout(grid_container)
+        self.scroll_area.setWidget(grid_container)
+
+        columns = max(1, math.ceil(math.sqrt(len(self.sources))))
+        self.tiles = []
+        for index, source in enumerate(self.sources):
+            tile = CameraTile(f"Camera {index + 1} ({source})")
+            self.grid.addWidget(tile, index // columns, index % columns)
+            self.tiles.append(tile)
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_tiles)
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(lambda: self.stats_updated.emit(self.manager.stats() if self.manager else {}))
+
+    def start(self, threshold):
+        self.threshold = threshold
+        self.manager = CameraManager(self.sources, threshold=threshold, event_log=self.event_log)
+        self.manager.start()
+        for tile in self.tiles:
+            tile.shown_sequence = -1
+        self.timer.start(30)
+        self.stats_timer.start(1000)
+
+    def set_threshold(self, value):
+        self.threshold = value
+        if self.manager is not None:
+            self.manager.set_threshold(value)
+
+    def stop(self):
+        self.timer.stop()
+        self.stats_timer.stop()
+        if self.manager is not None:
+            self.manager.stop()
+            self.manager = None
+        for tile in self.tiles:
+            tile.clear()
+            tile.setText(tile.name)
+
+    def update_tiles(self):
+        if self.manager is None or self.window().isMinimized():
+            return
+        for tile, channel in zip(self.tiles, self.manager.channels):
+            if not tile.is_exposed():
+                continue
+            latest = channel.latest()
+            if latest is None:
+                if channel.error is not None:
+                    tile.setText(f"{tile.name}: {channel.error}")
+                continue
+            frame, detection_result, sequence = latest
+            if sequence == tile.shown_sequence:
+                continue
+            tile.shown_sequence = sequence
+            # Each sequence is drawn once, so the channel's frame can be drawn on in place
+            if detection_result and detection_result[2] > self.threshold:
+                frame = visualize_result(frame, detection_result)
+            tile.show_frame(frame)
+
+    def is_running(self):
+        return self.manager is not None
+
+    def closeEvent(self, event):
+        self.stop()
+        super().closeEvent(event)
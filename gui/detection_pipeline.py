@@ -0,0 +1,156 @@
+# gui/detection_pipeline.py
+
+import time
+import traceback
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from config import PIPELINE_QUEUE_SIZE
+from pipeline import FrameQueue, RateMeter
+from profiling import profiler
+
+
+class StageThread(QThread):
+    """
+    Runs one pipeline stage: takes items from `input_queue` (or polls `work`
+    directly for a source stage), processes them and hands the output on.
+    An exception stops the stage; it is printed and sent out with `failed`.
+    """
+    failed = pyqtSignal(str)
+
+    def __init__(self, name, work, input_queue=None, output=None, parent=None):
+        super().__init__(parent)
+        self.setObjectName(name)
+        self.work = work
+        self.input_queue = input_queue
+        self.output = output
+        self.meter = RateMeter()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            item = None
+            if self.input_queue is not None:
+                item = self.input_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+
+            try:
+                start = time.perf_counter()
+                result = self.work(item)
+                if result is None:
+                    continue
+                elapsed = time.perf_counter() - start
+                self.meter.tick(elapsed)
+                profiler.record(self.objectName(), elapsed)
+
+                if self.output is not None:
+                    self.output(result)
+            except Exception as e:
+                traceback.print_exc()
+                self.failed.emit(f"{self.objectName()} stage failed: {e}")
+                break
+
+
+class DetectionPipeline(QObject):
+    """
+    Capture -> detect -> render pipeline running off the GUI thread.
+
+    Stages are joined by bounded FrameQueues that drop stale frames. The GUI
+    is notified through `frame_ready` and picks up the newest rendered frame
+    with take_frame(), so a busy GUI never builds up a backlog either. A stage
+    that raises stops and its error is sent out with `failed`; `finished`
+    fires when the camera's stream has ended.
+    """
+
+    frame_ready = pyqtSignal()
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+    detection_ready = pyqtSignal(object)
+    stats_updated = pyqtSignal(dict)
+
+    def __init__(self, camera, detector, renderer, queue_size=PIPELINE_QUEUE_SIZE, parent=None):
+        super().__init__(parent)
+        self.camera = camera
+        self.detector = detector
+        self.renderer = renderer
+
+        self.detect_queue = FrameQueue(queue_size)
+        self.render_queue = FrameQueue(queue_size)
+        self.display_queue = FrameQueue(1)
+        self.display_meter = RateMeter()
+
+        self.stages = [
+            StageThread('capture', self._capture, None, self.detect_queue.put),
+            StageThread('detect', self._detect, self.detect_queue, self.render_queue.put),
+            StageThread('render', self._render, self.render_queue, self._publish),
+        ]
+
+        for stage in self.stages:
+            stage.failed.connect(self.failed)
+
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(lambda: self.stats_updated.emit(self.stats()))
+
+    def _capture(self, _):
+        frame = self.camera.read_frame(timeout=0.1)
+        if frame is None and not self.camera.is_running():
+            # End of the stream: stop polling, the camera returns None at once from now on
+            self.stages[0].requestInterruption()
+            self.finished.emit()
+        return frame
+
+    def _detect(self, frame):
+        return frame, self.detector(frame)
+
+    def _render(self, item):
+        frame, detection_result = item
+        return self.renderer(frame, detection_result), detection_result
+
+    def _publish(self, item):
+        self.display_queue.put(item)
+        self.detection_ready.emit(item[1])
+        self.frame_ready.emit()
+
+    def take_frame(self):
+        """Return the newest (frame, detection_result) pair, or None if it was already taken."""
+        item = self.display_queue.get(timeout=0)
+        if item is not None:
+            self.display_meter.tick()
+        return item
+
+    def start(self):
+        for queue in (self.detect_queue, self.render_queue, self.display_queue):
+            queue.clear()
+        for stage in self.stages:
+            stage.start()
+        self.stats_timer.start(1000)
+
+    def stop(self):
+        self.stats_timer.stop()
+        for stage in self.stages:
+            stage.requestInterruption()
+        for queue in (self.detect_queue, self.render_queue, self.display_queue):
+            queue.close()
+        for stage in self.stages:
+            stage.wait()
+
+    def stats(self):
+        """Per-stage FPS, mean processing time (ms), input queue depth and dropped frames."""
+        stats = {}
+        for stage in self.stages:
+            if stage.input_queue is not None:
+                queue_depth, dropped = len(stage.input_queue), stage.input_queue.dropped
+            else:
+                # The source stage drops frames inside the camera's ring buffer
+                queue_depth, dropped = 0, getattr(self.camera, 'frames_dropped', 0)
+            stats[stage.objectName()] = {
+                'fps': stage.meter.rate,
+                'ms': stage.meter.mean_duration * 1000,
+                'queue_depth': queue_depth,
+                'dropped': dropped,
+            }
+        stats['display'] = {
+            'fps': self.display_meter.rate,
+            'ms': 0.0,
+            'queue_depth': len(self.display_queue),
+            'dropped': self.display_queue.dropped,
+        }
+        return stats
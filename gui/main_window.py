@@ -1,11 +1,11 @@
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QPushButton, 
                              QHBoxLayout, QMessageBox, QLabel, QSlider, QGroupBox)
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtGui import QIcon
-from .result_display_widget import ResultDisplayWidget
-from utils import load_template, save_count, load_count
-from config import MATCH_THRESHOLD
+from .startup import DetectorWarmup, TemplatePreviewLoader
+from config import MATCH_THRESHOLD, CAMERA_SOURCES, EVENT_LOG_DIR, EVENT_LOG_PORT
+import startup_timing
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -19,8 +19,13 @@ class MainWindow(QMainWindow):
 
         self.layout = QVBoxLayout(self.central_widget)
 
-        self.result_display = ResultDisplayWidget()
-        self.layout.addWidget(self.result_display)
+        # The detection widgets need cv2 and the detectors, which load in the background
+        self.result_display = None
+        self.camera_grid = None
+        self.event_log = None
+        self.loading_label = QLabel("Loading detectors...")
+        self.loading_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(self.loading_label, 1)
 
         self.control_layout = QHBoxLayout()
         self.layout.addLayout(self.control_layout)
@@ -80,6 +85,9 @@ class MainWindow(QMainWindow):
         self.count_label = QLabel("Count: 0")
         self.right_layout.addWidget(self.count_label)
 
+        self.pipeline_label = QLabel("Pipeline: -")
+        self.right_layout.addWidget(self.pipeline_label)
+
         self.capture_template_button.clicked.connect(self.start_template_capture)
         self.start_detection_button.clicked.connect(self.start_detection)
         self.stop_button.clicked.connect(self.stop)
@@ -94,6 +102,48 @@ class MainWindow(QMainWindow):
         self.update_button_states()
         self.update_template_preview()
 
+        self.warmup = DetectorWarmup(self)
+        self.warmup.ready.connect(self.create_detection_widgets)
+        self.warmup.failed.connect(self.show_warmup_error)
+        self.warmup.start()
+
+    def create_detection_widgets(self):
+        """Swap the loading placeholder for the detection widgets once the warm-up is done."""
+        from .result_display_widget import ResultDisplayWidget
+
+        self.result_display = ResultDisplayWidget()
+        self.result_display.set_match_threshold(self.threshold_slider.value() / 100)
+        self.layout.replaceWidget(self.loading_label, self.result_display)
+        self.loading_label.deleteLater()
+        self.result_display.pipeline_stats.connect(self.update_pipeline_stats)
+        self.result_display.count_changed.connect(self.update_count)
+        self.result_display.detection_failed.connect(self.show_detection_error)
+        self.result_display.detection_finished.connect(self.end_of_stream)
+
+        if EVENT_LOG_DIR:
+            from event_log import EventLog
+            self.event_log = EventLog(EVENT_LOG_DIR)
+            if EVENT_LOG_PORT:
+                self.event_log.serve(EVENT_LOG_PORT)
+            self.result_display.event_log = self.event_log
+
+        # Several cameras: detection runs in the grid, the single view is kept for template capture
+        if len(CAMERA_SOURCES) > 1:
+            from .camera_grid_widget import CameraGridWidget
+            self.camera_grid = CameraGridWidget(CAMERA_SOURCES, self.event_log)
+            self.layout.insertWidget(1, self.camera_grid)
+            self.camera_grid.stats_updated.connect(self.update_camera_stats)
+            self.result_display.hide()
+
+        self.update_button_states()
+        startup_timing.mark("detection widgets created")
+        startup_timing.finish()
+
+    def show_warmup_error(self, message):
+        self.loading_label.setText(f"Failed to load detectors:\n{message}")
+        self.status_label.setText("Status: Error")
+        startup_timing.finish()
+
     def start_template_capture(self):
         try:
             self.result_display.start_template_capture()
@@ -105,7 +155,10 @@ class MainWindow(QMainWindow):
 
     def start_detection(self):
         try:
-            self.result_display.start_detection()
+            if self.camera_grid is not None:
+                self.camera_grid.start(self.threshold_slider.value() / 100)
+            else:
+                self.result_display.start_detection()
             self.status_label.setText("Status: Detection Running")
             self.update_button_states()
         except Exception as e:
@@ -114,11 +167,23 @@ class MainWindow(QMainWindow):
     def stop(self):
         try:
             self.result_display.stop()
+            if self.camera_grid is not None:
+                self.camera_grid.stop()
             self.status_label.setText("Status: Idle")
+            self.pipeline_label.setText("Pipeline: -")
             self.update_button_states()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to stop: {str(e)}")
 
+    def show_detection_error(self, message):
+        self.stop()
+        self.status_label.setText("Status: Detection Failed")
+        QMessageBox.critical(self, "Error", f"Detection stopped: {message}")
+
+    def end_of_stream(self):
+        self.stop()
+        self.status_label.setText("Status: Stream Ended")
+
     def show_help(self):
         help_text = (
             "1. Click 'Capture Template' to select a template.\n"
@@ -133,11 +198,42 @@ class MainWindow(QMainWindow):
     def update_threshold(self):
         value = self.threshold_slider.value() / 100
         self.threshold_label.setText(f"Match Threshold: {value:.2f}")
-        self.result_display.set_match_threshold(value)
+        if self.result_display is not None:
+            self.result_display.set_match_threshold(value)
+        if self.camera_grid is not None:
+            self.camera_grid.set_threshold(value)
+
+    def update_pipeline_stats(self, stats):
+        lines = [
+            f"{stage.capitalize()}: {values['fps']:.1f} fps, {values['ms']:.1f} ms, "
+            f"queue {values['queue_depth']}, dropped {values['dropped']}"
+            for stage, values in stats.items()
+        ]
+        self.pipeline_label.setText("\n".join(lines))
+
+    def update_camera_stats(self, stats):
+        lines = [
+            f"{name}: {values['fps']:.1f} fps, {values['ms']:.1f} ms, dropped {values['frames_dropped']}"
+            for name, values in stats.items()
+        ]
+        self.pipeline_label.setText("\n".join(lines) or "Pipeline: -")
+
+    def update_count(self, count):
+        text = f"Count: {count['total']}"
+        if count['shift']:
+            text += f" (shift {count['shift']}: {count['shift_total']})"
+        self.count_label.setText(text)
 
     def update_button_states(self):
+        if self.result_display is None:
+            for button in (self.capture_template_button, self.start_detection_button, self.stop_button):
+                button.setEnabled(False)
+            return
+
         has_template = self.result_display.has_template()
         is_detecting = self.result_display.is_detecting()
+        if self.camera_grid is not None:
+            is_detecting = is_detecting or self.camera_grid.is_running()
 
         self.capture_template_button.setEnabled(not is_detecting)
         self.start_detection_button.setEnabled(has_template and not is_detecting)
@@ -151,23 +247,34 @@ class MainWindow(QMainWindow):
         # self.roi_right_button.setEnabled(roi_adjustable)
 
     def update_template_preview(self):
-        template, _ = load_template()
-        if template is not None:
-            height, width = template.shape[:2]
-            bytes_per_line = 3 * width
-            q_img = QImage(template.data, width, height, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
+        # Read the template off the GUI thread; show_template_preview runs when it is loaded
+        self.preview_loader = TemplatePreviewLoader(self)
+        self.preview_loader.loaded.connect(self.show_template_preview)
+        self.preview_loader.finished.connect(self.preview_loader.deleteLater)
+        self.preview_loader.start()
+
+    def show_template_preview(self, image):
+        if image is not None:
+            pixmap = QPixmap.fromImage(image)
             pixmap = pixmap.scaled(200, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
             self.template_preview.setPixmap(pixmap)
         else:
             self.template_preview.setText("No template")
+        startup_timing.mark("template preview shown")
 
     def adjust_roi(self, dx, dy):
         self.result_display.adjust_roi(dx, dy)
         self.update_template_preview()
 
     def closeEvent(self, event):
-        self.result_display.stop()
+        self.warmup.wait()
+        if self.result_display is not None:
+            self.result_display.stop()
+            self.result_display.close_count_store()
+        if self.camera_grid is not None:
+            self.camera_grid.stop()
+        if self.event_log is not None:
+            self.event_log.close()
         super().closeEvent(event)
 
 if __name__ == "__main__":
@@ -1,14 +1,70 @@
+import time
 import cv2
 import numpy as np
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QMessageBox
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap
 from camera_feed import CameraFeed
-from object_detection import detect_object
-from visualization import visualize_result
-from utils import save_template, load_template, resize_image
+from config import (CAMERA_THREADED, DETECTION_PIPELINE, PERFORMANCE_OVERLAY, PROFILING_DUMP_FILE,
+                    ROTATION_MATCHING, RECORDER_FILE)
+from .detection_pipeline import DetectionPipeline
+from frame_recorder import FrameRecorder, recording_path
+from motion_gate import MotionGate
+from object_counter import CountStore, ObjectCounter, shift_for
+from object_detection import rotation_banks, rotation_invariant_detection
+from profiling import profiler
+from tracking import TrackingDetector
+from visualization import visualize_result, draw_overlay
+from template_registry import template_registry
+from utils import save_template
+
+# Stages shown in the performance overlay
+OVERLAY_STAGES = ['capture', 'detect', 'match_template', 'draw', 'display']
+
+# Qt 5.14+ can wrap BGR buffers directly; older versions need a BGR->RGB pass
+HAS_BGR888 = hasattr(QImage, 'Format_BGR888')
+
+
+class FrameView:
+    """
+    Shows BGR frames on a QLabel through reused buffers: one resize straight to
+    the label size, then a QImage that wraps the buffer without copying.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self._display_buffer = None
+        self._rgb_buffer = None
+
+    def show(self, frame):
+        frame_height, frame_width = frame.shape[:2]
+        scale = min(max(1, self.label.width()) / frame_width,
+                    max(1, self.label.height()) / frame_height)
+        width, height = max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+
+        if self._display_buffer is None or self._display_buffer.shape[:2] != (height, width):
+            self._display_buffer = np.empty((height, width, 3), np.uint8)
+            self._rgb_buffer = None if HAS_BGR888 else np.empty((height, width, 3), np.uint8)
+
+        # Bilinear matches Qt's SmoothTransformation; INTER_AREA is several times slower at non-integer ratios
+        cv2.resize(frame, (width, height), dst=self._display_buffer, interpolation=cv2.INTER_LINEAR)
+
+        if HAS_BGR888:
+            buffer, image_format = self._display_buffer, QImage.Format_BGR888
+        else:
+            buffer, image_format = cv2.cvtColor(self._display_buffer, cv2.COLOR_BGR2RGB, dst=self._rgb_buffer), QImage.Format_RGB888
+
+        # QImage wraps the buffer without copying; QPixmap.fromImage makes the only copy
+        qt_image = QImage(buffer.data, width, height, buffer.strides[0], image_format)
+        self.label.setPixmap(QPixmap.fromImage(qt_image))
+
 
 class ResultDisplayWidget(QWidget):
+    pipeline_stats = pyqtSignal(dict)
+    count_changed = pyqtSignal(dict)
+    detection_failed = pyqtSignal(str)
+    detection_finished = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.layout = QVBoxLayout(self)
@@ -16,18 +72,27 @@ class ResultDisplayWidget(QWidget):
         self.image_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(self.image_label)
 
-        self.camera = CameraFeed()
+        self.camera = CameraFeed(threaded=CAMERA_THREADED)
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
+        self.pipeline = None
 
         self.mode = 'idle'
         self.current_frame = None
+        self.last_result = None  # Unthresholded result of the newest detection
+        self.frame_view = FrameView(self.image_label)
         self.roi_coords = None
         self.is_drawing = False
         self.match_threshold = 0.98
         self._has_template = False
         self._is_detecting = False
         self.template = None
+        self.tracker = None
+        self.motion_gate = None
+        self.count_store = None
+        self.recorder = None
+        self.counter = None
+        self.event_log = None  # Set by the main window when EVENT_LOG_DIR is configured
 
     def start_template_capture(self):
         self.camera.start()
@@ -39,7 +104,7 @@ class ResultDisplayWidget(QWidget):
         self.template_captured = False
         
         while not self.template_captured:
-            frame = self.camera.read_frame()
+            frame = self.camera.read_frame(timeout=1.0)
             if frame is None:
                 break
             
@@ -77,7 +142,7 @@ class ResultDisplayWidget(QWidget):
 
     def capture_template(self):
         if self.roi_coords:
-            frame = self.camera.read_frame()
+            frame = self.camera.read_frame(timeout=1.0)
             if frame is not None:
                 x1, y1, x2, y2 = self.roi_coords
                 # Ensure coordinates are in the correct order
@@ -94,6 +159,7 @@ class ResultDisplayWidget(QWidget):
                     template = frame[y1:y2, x1:x2]
                     if template.size > 0:
                         save_template(template, [x1, y1, x2, y2])
+                        template_registry.invalidate()
                         self.template_captured = True
                         self._has_template = True
                         QMessageBox.information(self, "Success", "Template captured successfully!")
@@ -108,21 +174,48 @@ class ResultDisplayWidget(QWidget):
 
     def start_detection(self):
         self.mode = 'detection'
-        template_data = load_template()
-        if template_data is None or len(template_data) != 2:
-            QMessageBox.warning(self, "Warning", "Failed to load template. Please capture a new template.")
-            return
-        self.template, self.roi_coords = template_data
-        if self.template is None or self.roi_coords is None:
+        self.template = template_registry.get()
+        if self.template is None or self.template.roi_coords is None:
             QMessageBox.warning(self, "Warning", "Failed to load template. Please capture a new template.")
             return
+        self.roi_coords = self.template.roi_coords
+        self.tracker = TrackingDetector(self.template, self.match_threshold)
+        if ROTATION_MATCHING:
+            # Build the rotated templates now rather than on the first frame
+            rotation_banks(self.template)
+            # Unthresholded like the other detectors, so a threshold change only needs a redraw
+            self.motion_gate = MotionGate(
+                lambda frame: rotation_invariant_detection(frame, None, template=self.template))
+        else:
+            self.motion_gate = MotionGate(self.tracker.detect, self.tracker.detect_region, self.template.shape)
+        if self.counter is None:
+            self.count_store = CountStore()
+            self.counter = ObjectCounter(self.count_store, self.match_threshold)
+        self.emit_count()
         self.camera.start()
-        self.timer.start(30)
+        if DETECTION_PIPELINE:
+            self.pipeline = DetectionPipeline(self.camera, self.detect_frame, self.render_result, parent=self)
+            self.pipeline.frame_ready.connect(self.show_pipeline_frame)
+            self.pipeline.stats_updated.connect(self.pipeline_stats)
+            self.pipeline.failed.connect(self.detection_failed)
+            self.pipeline.finished.connect(self.detection_finished)
+            self.pipeline.start()
+        else:
+            self.timer.start(30)
         self._is_detecting = True
 
     def stop(self):
         self.timer.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline.deleteLater()
+            self.pipeline = None
         self.camera.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if PROFILING_DUMP_FILE and self._is_detecting:
+            profiler.dump(PROFILING_DUMP_FILE)
         self.mode = 'idle'
         self.clear_display()
         self._is_detecting = False
@@ -131,39 +224,115 @@ class ResultDisplayWidget(QWidget):
         self.image_label.clear()
 
     def update_frame(self):
-        frame = self.camera.read_frame()
+        with profiler.stage('capture'):
+            frame = self.camera.read_frame()
         if frame is not None:
-            self.current_frame = frame.copy()
+            self.current_frame = frame
             if self.mode == 'detection':
-                detection_result = detect_object(frame, self.template)
-                if detection_result:
-                    frame = visualize_result(frame, detection_result)
-                    
-                    # Draw ROI
-                    cv2.rectangle(frame, (self.roi_coords[0], self.roi_coords[1]),
-                                  (self.roi_coords[2], self.roi_coords[3]), (0, 0, 255), 2)
-                    
-                    # Change ROI color if object detected
-                    if detection_result[2] > self.match_threshold:
-                        cv2.rectangle(frame, (self.roi_coords[0], self.roi_coords[1]),
-                                      (self.roi_coords[2], self.roi_coords[3]), (0, 255, 0), 2)
-                else:
-                    cv2.putText(frame, "No match found", (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                with profiler.stage('detect'):
+                    detection_result = self.detect_frame(frame)
+                frame = self.render_result(frame, detection_result)
             
             self.display_frame(frame)
+        elif self.mode == 'detection' and not self.camera.is_running():
+            self.timer.stop()
+            self.detection_finished.emit()
+
+    def show_pipeline_frame(self):
+        if self.pipeline is None:
+            return
+        item = self.pipeline.take_frame()
+        if item is not None:
+            frame, _ = item
+            self.current_frame = frame
+            self.display_frame(frame)
+
+    def detect_frame(self, frame):
+        detection_result = self.motion_gate.detect(frame)
+        self.last_result = detection_result
+        if RECORDER_FILE:
+            # Record before the result is drawn onto the frame
+            if self.recorder is not None and self.recorder.frame_shape != frame.shape:
+                # The camera changed resolution: keep the old recording and start another
+                self.recorder.close()
+                self.recorder = None
+            if self.recorder is None:
+                self.recorder = FrameRecorder(recording_path(RECORDER_FILE), frame.shape)
+            with profiler.stage('record'):
+                self.recorder.record(frame, detection_result)
+        if self.event_log is not None:
+            self.event_log.record_detection(detection_result, self.match_threshold, self.template.name, "Camera 1")
+        # Runs on the detect thread when pipelined; signals are queued to the GUI thread
+        if self.counter.update(detection_result, self.template.name):
+            self.emit_count()
+        return detection_result
+
+    def emit_count(self):
+        shift, _ = shift_for(time.time(), self.counter.shifts)
+        self.count_changed.emit({
+            'total': self.counter.total(self.template.name),
+            'shift': shift,
+            'shift_total': self.counter.current_shift_total(self.template.name),
+        })
+
+    def render_result(self, frame, detection_result):
+        """Draw the detection result and ROI onto the frame. Safe to call off the GUI thread."""
+        with profiler.stage('draw'):
+            return self._draw_result(frame, detection_result)
+
+    def _draw_result(self, frame, detection_result):
+        overlay_lines = None
+        if PERFORMANCE_OVERLAY:
+            display = profiler.stats().get('display')
+            overlay_lines = [f"FPS: {display['rate']:.1f}" if display else "FPS: -"]
+            overlay_lines += profiler.summary_lines(OVERLAY_STAGES)
+
+        if detection_result:
+            frame = visualize_result(frame, detection_result, overlay_lines)
+            
+            # Draw ROI
+            cv2.rectangle(frame, (self.roi_coords[0], self.roi_coords[1]),
+                          (self.roi_coords[2], self.roi_coords[3]), (0, 0, 255), 2)
+            
+            # Change ROI color if object detected
+            if detection_result[2] > self.match_threshold:
+                cv2.rectangle(frame, (self.roi_coords[0], self.roi_coords[1]),
+                              (self.roi_coords[2], self.roi_coords[3]), (0, 255, 0), 2)
+        else:
+            cv2.putText(frame, "No match found", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+            if overlay_lines:
+                draw_overlay(frame, overlay_lines)
+        return frame
 
     def display_frame(self, frame):
-        frame = resize_image(frame)  # Resize the frame if it's too large
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qt_image)
-        self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        with profiler.stage('display'):
+            self._display_frame(frame)
+
+    def _display_frame(self, frame):
+        self.frame_view.show(frame)
 
     def set_match_threshold(self, value):
         self.match_threshold = value
+        if self.tracker is not None:
+            self.tracker.threshold = value
+        if self.counter is not None:
+            self.counter.threshold = value
+        self.reapply_threshold()
+
+    def reapply_threshold(self):
+        """
+        Redraw the newest frame with the current threshold, so that a change
+        shows even when the camera has stalled. Only the display changes: the
+        motion gate, recorder, counter and event log do not see the frame again.
+        """
+        if self.mode != 'detection' or self.motion_gate is None:
+            return
+        frame = self.camera.peek_frame()
+        if frame is None:
+            return
+        # The detectors return their best match whatever its score; only drawing applies the threshold
+        self.display_frame(self.render_result(frame, self.last_result))
 
     def has_template(self):
         return self._has_template
@@ -179,6 +348,13 @@ class ResultDisplayWidget(QWidget):
     #         self.roi_coords[3] += dy
     #         update_roi_coords(self.roi_coords)
 
+    def close_count_store(self):
+        if self.count_store is not None:
+            self.count_store.close()
+            self.count_store = None
+            self.counter = None
+
     def closeEvent(self, event):
         self.stop()
+        self.close_count_store()
         super().closeEvent(event)
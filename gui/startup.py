@@ -0,0 +1,58 @@
+# gui/startup.py
+
+import threading
+import traceback
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+import startup_timing
+from config import CAMERA_SOURCES
+
+
+class DetectorWarmup(QThread):
+    """
+    Imports cv2, NumPy, the camera and the detectors on a background thread
+    and compiles the saved template, so the main window can be shown first.
+    `ready` fires once the detection widgets can be created without delay;
+    `failed` carries the error if the imports or the template fail instead.
+    """
+    ready = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def run(self):
+        threading.current_thread().name = "DetectorWarmup"
+        try:
+            from . import result_display_widget  # noqa: F401  (cv2, numpy, camera, detectors)
+            if len(CAMERA_SOURCES) > 1:
+                from . import camera_grid_widget  # noqa: F401
+            startup_timing.mark("detector modules imported")
+
+            from template_registry import template_registry
+            template_registry.get()
+            startup_timing.mark("template compiled")
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(f"{type(e).__name__}: {e}")
+            return
+        self.ready.emit()
+
+
+class TemplatePreviewLoader(QThread):
+    """Reads the saved template off the GUI thread; `loaded` carries a QImage, or None without a template."""
+    loaded = pyqtSignal(object)
+
+    def run(self):
+        threading.current_thread().name = "TemplatePreviewLoader"
+        import cv2
+        from utils import load_template
+
+        template, _ = load_template()
+        if template is None:
+            self.loaded.emit(None)
+            return
+        rgb = cv2.cvtColor(template, cv2.COLOR_BGR2RGB)
+        height, width = rgb.shape[:2]
+        # Copy so that the image owns its pixels once the array goes away
+        image = QImage(rgb.data, width, height, rgb.strides[0], QImage.Format_RGB888).copy()
+        self.loaded.emit(image)
@@ -1,14 +1,25 @@
 # main.py
 
+import startup_timing  # First, so that the startup clock starts before anything heavy is imported
 import sys
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication
 from gui.main_window import MainWindow
+from config import METRICS_PORT, STARTUP_REPORT
+from profiling import profiler
 
 
 def main():
+    startup_timing.enabled = STARTUP_REPORT or '--startup-report' in sys.argv
+    startup_timing.mark("modules imported")
+    if METRICS_PORT:
+        profiler.serve(METRICS_PORT)
     app = QApplication(sys.argv)
+    startup_timing.mark("Qt application created")
     window = MainWindow()
+    startup_timing.mark("main window built")
     window.show()
+    QTimer.singleShot(0, lambda: startup_timing.mark("window shown"))
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+# motion_gate.py
+
+import cv2
+import numpy as np
+
+from config import (MOTION_GATE_ENABLED, MOTION_THRESHOLD, MOTION_SIGNATURE_WIDTH, MOTION_TILES,
+                    MOTION_TILE_RECHECK, MOTION_MAX_SKIP)
+
+
+def frame_signature(frame, width=MOTION_SIGNATURE_WIDTH):
+    """Tiny grayscale thumbnail of the frame used to detect change cheaply."""
+    height = max(1, int(round(frame.shape[0] * width / frame.shape[1])))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    if len(small.shape) == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small.astype(np.float32)
+
+
+class MotionGate:
+    """
+    Skips detection on frames that have not changed.
+
+    Each frame's signature is compared, tile by tile, with the signature at
+    the last detection run. If no thumbnail pixel changed by more than
+    `threshold` (in gray levels), the last detection result is reused. With
+    `tile_recheck` and a `region_detector`, a local change is re-checked only in
+    the changed tiles (plus the last hit), grown by the template size, instead
+    of the whole frame. Every `max_skip` skipped frames a full detection runs anyway.
+    """
+
+    def __init__(self, detector, region_detector=None, template_shape=None, threshold=MOTION_THRESHOLD,
+                 signature_width=MOTION_SIGNATURE_WIDTH, tiles=MOTION_TILES, tile_recheck=MOTION_TILE_RECHECK,
+                 max_skip=MOTION_MAX_SKIP, enabled=MOTION_GATE_ENABLED):
+        self.detector = detector
+        self.region_detector = region_detector
+        self.template_shape = template_shape
+        self.threshold = threshold
+        self.signature_width = signature_width
+        self.tiles = tiles
+        self.tile_recheck = tile_recheck and region_detector is not None
+        self.max_skip = max_skip
+        self.enabled = enabled
+
+        self.reference = None
+        self.last_result = None
+        self.skipped_in_row = 0
+
+        self.frames = 0
+        self.skipped = 0
+        self.tile_checks = 0
+        self.full_checks = 0
+
+    def reset(self):
+        self.reference = None
+        self.last_result = None
+        self.skipped_in_row = 0
+
+    def changed_tiles(self, signature):
+        """
+        Boolean (rows, cols) grid of tiles in which some thumbnail pixel changed
+        by more than the threshold. Using the maximum rather than the tile mean
+        keeps a small moving part from being averaged away.
+        """
+        rows, cols = self.tiles
+        difference = cv2.absdiff(signature, self.reference)
+        height, width = difference.shape[:2]
+        row_edges = np.linspace(0, height, rows + 1).astype(int)
+        col_edges = np.linspace(0, width, cols + 1).astype(int)
+        peaks = np.maximum.reduceat(np.maximum.reduceat(difference, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+        return peaks > self.threshold, row_edges, col_edges
+
+    def detect(self, frame):
+        self.frames += 1
+        if not self.enabled:
+            return self.detector(frame)
+
+        signature = frame_signature(frame, self.signature_width)
+        if self.reference is None or self.reference.shape != signature.shape or self.skipped_in_row >= self.max_skip:
+            return self._full(frame, signature)
+
+        changed, row_edges, col_edges = self.changed_tiles(signature)
+        if not changed.any():
+            self.skipped += 1
+            self.skipped_in_row += 1
+            return self.last_result
+
+        if not self.tile_recheck or self.last_result is None or changed.mean() > 0.5:
+            return self._full(frame, signature)
+
+        return self._tiles(frame, signature, changed, row_edges, col_edges)
+
+    def _full(self, frame, signature):
+        self.full_checks += 1
+        self.skipped_in_row = 0
+        self.reference = signature
+        self.last_result = self.detector(frame)
+        return self.last_result
+
+    def _tiles(self, frame, signature, changed, row_edges, col_edges):
+        self.tile_checks += 1
+        self.skipped_in_row = 0
+
+        # Bounding box of the changed tiles in frame coordinates, plus the last hit
+        scale = frame.shape[1] / signature.shape[1]
+        rows, cols = np.nonzero(changed)
+        x1, x2 = col_edges[cols.min()] * scale, col_edges[cols.max() + 1] * scale
+        y1, y2 = row_edges[rows.min()] * scale, row_edges[rows.max() + 1] * scale
+
+        (lx1, ly1), (lx2, ly2) = self.last_result[:2]
+        x1, y1, x2, y2 = min(x1, lx1), min(y1, ly1), max(x2, lx2), max(y2, ly2)
+
+        # A match window may start up to one template size before a changed pixel
+        template_height, template_width = self.template_shape[:2] if self.template_shape else (0, 0)
+        box = (int(max(0, x1 - template_width)), int(max(0, y1 - template_height)),
+               int(min(frame.shape[1], x2 + template_width)), int(min(frame.shape[0], y2 + template_height)))
+        detection_result = self.region_detector(frame, box)
+
+        # Only the changed tiles of the reference are updated, so slow drift elsewhere still adds up
+        for row, col in zip(rows, cols):
+            tile = (slice(row_edges[row], row_edges[row + 1]), slice(col_edges[col], col_edges[col + 1]))
+            self.reference[tile] = signature[tile]
+
+        self.last_result = detection_result
+        return detection_result
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'tile_checks': self.tile_checks,
+            'full_checks': self.full_checks,
+        }
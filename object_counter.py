@@ -0,0 +1,219 @@
+# object_counter.py
+
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+
+from config import (MATCH_THRESHOLD, COUNT_DB_FILE, COUNT_HYSTERESIS, COUNT_FLUSH_INTERVAL,
+                    COUNT_BATCH_SIZE, COUNT_QUEUE_SIZE, SHIFTS)
+
+
+def shift_for(timestamp, shifts=SHIFTS):
+    """
+    Return (shift_name, shift_date) for a UNIX timestamp. Shifts are
+    (name, start_hour, end_hour) tuples; one that crosses midnight belongs to
+    the date it started on.
+    """
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    hour = moment.hour + moment.minute / 60
+    for name, start, end in shifts:
+        if start <= end:
+            if start <= hour < end:
+                return name, moment.date().isoformat()
+        elif hour >= start:
+            return name, moment.date().isoformat()
+        elif hour < end:
+            return name, (moment.date() - datetime.timedelta(days=1)).isoformat()
+    return None, moment.date().isoformat()
+
+
+class CountStore:
+    """
+    Append-only SQLite log of count events. Writes are queued and committed
+    in batches by a background thread (every `flush_interval` seconds or
+    `batch_size` events), so the detection path never waits on disk. The
+    database runs in WAL mode, so a crash loses at most the unflushed batch.
+    When the queue is full, events are dropped and counted in `dropped`.
+    Batches that cannot be written (disk full, lock timeout) are counted in
+    `failed` and the error kept in `error`; the writer reconnects and carries on.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS count_events (
+            id INTEGER PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            template TEXT NOT NULL,
+            score REAL,
+            shift TEXT,
+            shift_date TEXT
+        );
+        CREATE INDEX IF NOT EXISTS count_events_shift ON count_events (shift_date, shift, template);
+    """
+
+    def __init__(self, path=COUNT_DB_FILE, flush_interval=COUNT_FLUSH_INTERVAL, batch_size=COUNT_BATCH_SIZE,
+                 queue_size=COUNT_QUEUE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.failed = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._read_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.executescript(self.SCHEMA)
+        connection.commit()
+        self._reader = connection
+
+        self._thread = threading.Thread(target=self._writer_loop, name="CountStore", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _writer_loop(self):
+        connection = None
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, threading.Event):
+                    # flush() marker: commit what we have, then wake the caller
+                    connection = self._write(connection, batch)
+                    batch = []
+                    item.set()
+                    continue
+                batch.append(item)
+            connection = self._write(connection, batch)
+        if connection is not None:
+            connection.close()
+
+    def _write(self, connection, batch):
+        """Commit a batch; returns the connection to use next, None after an error."""
+        if not batch:
+            return connection
+        try:
+            if connection is None:
+                connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO count_events (timestamp, template, score, shift, shift_date) VALUES (?, ?, ?, ?, ?)",
+                    batch)
+        except sqlite3.Error as e:
+            # Drop the batch and reconnect for the next one
+            self.failed += len(batch)
+            self.error = e
+            if connection is not None:
+                connection.close()
+            return None
+        return connection
+
+    def add(self, timestamp, template, score, shift, shift_date):
+        try:
+            self._queue.put_nowait((timestamp, template, score, shift, shift_date))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until every queued event is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'error': repr(self.error) if self.error is not None else None,
+        }
+
+    def totals(self):
+        """Committed event counts per template."""
+        with self._read_lock:
+            rows = self._reader.execute("SELECT template, COUNT(*) FROM count_events GROUP BY template").fetchall()
+        return dict(rows)
+
+    def shift_rollup(self, since_date=None):
+        """Committed counts as a list of (shift_date, shift, template, count), newest first."""
+        query = "SELECT shift_date, shift, template, COUNT(*) FROM count_events"
+        params = ()
+        if since_date:
+            query += " WHERE shift_date >= ?"
+            params = (since_date,)
+        query += " GROUP BY shift_date, shift, template ORDER BY shift_date DESC, shift"
+        with self._read_lock:
+            return self._reader.execute(query, params).fetchall()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        with self._read_lock:
+            self._reader.close()
+
+
+class ObjectCounter:
+    """
+    Counts parts from per-frame detection scores with hysteresis: a part is
+    counted when the score rises to `threshold` and the counter re-arms only
+    after the score drops below `threshold - hysteresis`, so a part sitting in
+    view is counted once rather than on every frame.
+    """
+
+    def __init__(self, store=None, threshold=MATCH_THRESHOLD, hysteresis=COUNT_HYSTERESIS, shifts=SHIFTS):
+        self.store = store
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.shifts = shifts
+        self._armed = {}
+        self.counts = dict(store.totals()) if store is not None else {}
+        self.shift_counts = {}
+        if store is not None:
+            for shift_date, shift, template, count in store.shift_rollup():
+                self.shift_counts[(shift_date, shift, template)] = count
+
+    def update(self, detection_result, template='template', timestamp=None):
+        """Feed one frame's detection result; return True if it produced a new count."""
+        score = detection_result[2] if detection_result else 0.0
+        armed = self._armed.get(template, True)
+
+        if armed and score >= self.threshold:
+            self._armed[template] = False
+            self._count(template, score, time.time() if timestamp is None else timestamp)
+            return True
+        if not armed and score < self.threshold - self.hysteresis:
+            self._armed[template] = True
+        return False
+
+    def _count(self, template, score, timestamp):
+        shift, shift_date = shift_for(timestamp, self.shifts)
+        self.counts[template] = self.counts.get(template, 0) + 1
+        key = (shift_date, shift, template)
+        self.shift_counts[key] = self.shift_counts.get(key, 0) + 1
+        if self.store is not None:
+            self.store.add(timestamp, template, float(score), shift, shift_date)
+
+    def total(self, template=None):
+        if template is None:
+            return sum(self.counts.values())
+        return self.counts.get(template, 0)
+
+    def current_shift_total(self, template=None, timestamp=None):
+        shift, shift_date = shift_for(time.time() if timestamp is None else timestamp, self.shifts)
+        return sum(count for (day, name, name_template), count in self.shift_counts.items()
+                   if day == shift_date and name == shift and (template is None or name_template == template))
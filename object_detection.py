@@ -1,35 +1,344 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from utils import load_template
+from config import (PYRAMID_LEVELS, PYRAMID_CANDIDATES, DETECTION_WORKERS, MATCH_METHOD, FFT_AREA_RATIO,
+                    DETECTION_SCALE, DETECTION_REFINE, ROTATION_RANGE, ROTATION_COARSE_STEP, ROTATION_FINE_STEP,
+                    ROTATION_SCALE_RANGE, ROTATION_SCALE_STEPS, ROTATION_DOWNSAMPLE, ROTATION_CANDIDATES,
+                    ROTATION_REFINE_ROUNDS, DETECTION_BACKEND, TEMPLATE_BACKENDS, FEATURE_FRAME_KEYPOINTS,
+                    FEATURE_THRESHOLD, SCALE_PRUNING, SCALE_GOOD_ENOUGH, SCALE_PRUNE_DOWNSAMPLE,
+                    SCALE_PRUNE_SLACK)
+from feature_matching import compute_features, match_features
+from fft_matching import dft_size, frame_spectrum, frame_integrals, window_deviation, match_template_fft
+from profiling import profiler
+from score_cache import frame_digest, score_cache
+from template_registry import CompiledTemplate, get_template, get_library, rotate_template
+
+_executor = None
+
+# Per-thread scratch buffers for reduced-resolution detection
+_buffers = threading.local()
+
+# Raw template images compiled by resolve_template, by content, so that callers passing the same
+# array every frame reuse one CompiledTemplate (and its uid in the score and engine caches)
+RAW_TEMPLATE_CACHE = 16
+_raw_templates = OrderedDict()
+_raw_templates_lock = threading.Lock()
+
+def get_executor():
+    """Shared thread pool for per-template matching; OpenCV releases the GIL while matching."""
+    global _executor
+    if _executor is None:
+        workers = DETECTION_WORKERS or os.cpu_count() or 1
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detect")
+    return _executor
+
+class FrameContext:
+    """
+    Per-frame data shared by every template matched against the same frame.
+    Derived forms are computed on first use and then reused.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._gray = None
+        self._downsampled = {}
+        self._integrals = None
+        self._spectra = {}
+        self._deviations = {}
+        self._features = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            frame = self.frame
+            with profiler.stage('grayscale'):
+                self._gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+        return self._gray
+
+    @property
+    def digest(self):
+        """Content key of the grayscale frame for the score map cache."""
+        if self._digest is None:
+            self._digest = frame_digest(self.gray)
+        return self._digest
+
+    def downsampled(self, factor):
+        """Grayscale frame shrunk by an integer factor."""
+        image = self._downsampled.get(factor)
+        if image is None:
+            height, width = self.gray.shape[:2]
+            image = cv2.resize(self.gray, (max(1, width // factor), max(1, height // factor)),
+                               interpolation=cv2.INTER_AREA)
+            self._downsampled[factor] = image
+        return image
+
+    def spectrum(self, size):
+        """DFT of the grayscale frame padded to `size`, shared by all FFT matches."""
+        with self._lock:
+            spectrum = self._spectra.get(size)
+            if spectrum is None:
+                spectrum = self._spectra[size] = frame_spectrum(self.gray, size)
+            return spectrum
+
+    def deviation(self, height, width):
+        """Per-window deviation for a template size, shared by all FFT matches of that size."""
+        with self._lock:
+            if self._integrals is None:
+                self._integrals = frame_integrals(self.gray)
+            deviation = self._deviations.get((height, width))
+            if deviation is None:
+                deviation = self._deviations[(height, width)] = window_deviation(self._integrals, height, width)
+            return deviation
+
+    def features(self):
+        """ORB keypoints of the frame, shared by every template using the feature backend."""
+        with self._lock:
+            if self._features is None:
+                with profiler.stage('frame_features'):
+                    self._features = compute_features(self.gray, FEATURE_FRAME_KEYPOINTS)
+            return self._features
+
+def choose_match_method(frame_shape, template_shape):
+    """Pick 'fft' or 'spatial' from MATCH_METHOD, or from the template/frame area ratio in 'auto' mode."""
+    if MATCH_METHOD != 'auto':
+        return MATCH_METHOD
+    ratio = (template_shape[0] * template_shape[1]) / (frame_shape[0] * frame_shape[1])
+    return 'fft' if ratio >= FFT_AREA_RATIO else 'spatial'
+
+def match_template(context, template, level):
+    """
+    TM_CCOEFF_NORMED score map of one template level over the whole frame.
+    Score maps of repeated frames come from the score cache and are read-only.
+    """
+    frame_gray = context.gray
+    level_gray = level.gray
+
+    key = None
+    if score_cache.enabled:
+        key = (context.digest, template.uid, level.scale, level_gray.shape)
+        result = score_cache.get(key)
+        if result is not None:
+            return result
+
+    with profiler.stage('match_template'):
+        if choose_match_method(frame_gray.shape, level_gray.shape) == 'fft':
+            size = dft_size(frame_gray.shape)
+            result = match_template_fft(context.spectrum(size), context.deviation(*level_gray.shape[:2]),
+                                        level_gray.shape, level.norm, template.spectrum(level, size))
+        else:
+            result = cv2.matchTemplate(frame_gray, level_gray, cv2.TM_CCOEFF_NORMED)
+
+    if key is not None:
+        score_cache.put(key, result)
+    return result
+
+def resolve_template(template=None):
+    """Return a CompiledTemplate from the registry, an existing one, or a raw image."""
+    if template is None:
+        return get_template()
+    if isinstance(template, CompiledTemplate):
+        return template
+    key = frame_digest(template)
+    with _raw_templates_lock:
+        compiled = _raw_templates.get(key)
+        if compiled is not None:
+            _raw_templates.move_to_end(key)
+            return compiled
+    compiled = CompiledTemplate(None, template)
+    with _raw_templates_lock:
+        compiled = _raw_templates.setdefault(key, compiled)
+        while len(_raw_templates) > RAW_TEMPLATE_CACHE:
+            _raw_templates.popitem(last=False)
+    return compiled
+
+def template_backend(template):
+    """'template' or 'features', from TEMPLATE_BACKENDS with DETECTION_BACKEND as the default."""
+    return TEMPLATE_BACKENDS.get(template.name, DETECTION_BACKEND)
+
+def feature_detection(frame, template=None, context=None):
+    """
+    Detection with the ORB feature backend. Returns (top_left, bottom_right,
+    score, scale, angle), where the box bounds the template outline projected
+    by the homography and the score is the fraction of ratio-test matches that
+    are RANSAC inliers, or None if the template is not found or that fraction
+    is below FEATURE_THRESHOLD.
+    """
+    template = resolve_template(template)
+    if template is None:
+        return None
+
+    context = context or FrameContext(frame)
+    frame_features = context.features()
+    with profiler.stage('feature_match'):
+        with template.match_lock:
+            match = match_features(frame_features, template.features(), template.matcher(), template.shape)
+    if match is None:
+        return None
+
+    homography, corners, inliers, matches = match
+    frame_height, frame_width = context.gray.shape[:2]
+    x, y, w, h = cv2.boundingRect(corners)
+    top_left = (max(0, x), max(0, y))
+    bottom_right = (min(frame_width, x + w), min(frame_height, y + h))
+
+    # Scale and in-plane angle of the affine part, in the same convention as the rotation detector
+    affine = homography[:2, :2] / homography[2, 2]
+    scale = float(np.sqrt(abs(np.linalg.det(affine))))
+    angle = float(np.degrees(np.arctan2(affine[0, 1], affine[0, 0])))
+    if inliers / matches < FEATURE_THRESHOLD:
+        return None
+    return (top_left, bottom_right, inliers / matches, scale, angle)
 
 def detect_object(frame, template=None):
+    template = resolve_template(template)
     if template is None:
-        template_data = load_template()
-        if template_data is None or len(template_data) != 2:
-            return None
-        template, _ = template_data
+        return None
 
+    if template_backend(template) == 'features':
+        return feature_detection(frame, template)
+
+    if DETECTION_SCALE < 1.0:
+        return detect_object_reduced(frame, template, DETECTION_SCALE, DETECTION_REFINE)
+
+    return match_best(FrameContext(frame), template)
+
+def reduce_frame(frame, scale):
+    """
+    Grayscale copy of the frame downsampled by `scale`. The output lives in a
+    per-thread buffer that is reused by the next call on the same thread.
+    """
+    height, width = frame.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+
+    if len(frame.shape) == 3:
+        gray = getattr(_buffers, 'gray', None)
+        if gray is None or gray.shape != (height, width):
+            gray = _buffers.gray = np.empty((height, width), np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+    else:
+        gray = frame
+
+    reduced = getattr(_buffers, 'reduced', None)
+    if reduced is None or reduced.shape != (size[1], size[0]):
+        reduced = _buffers.reduced = np.empty((size[1], size[0]), np.uint8)
+    cv2.resize(gray, size, dst=reduced, interpolation=cv2.INTER_AREA)
+    return reduced
+
+def subpixel_peak(result, loc):
+    """Refine an integer peak of a score map with a parabola fit in x and y."""
+    x, y = loc
+    height, width = result.shape[:2]
+    dx = dy = 0.0
+    if 0 < x < width - 1:
+        left, centre, right = result[y, x - 1], result[y, x], result[y, x + 1]
+        denominator = left - 2 * centre + right
+        if denominator < 0:
+            dx = 0.5 * (left - right) / denominator
+    if 0 < y < height - 1:
+        up, centre, down = result[y - 1, x], result[y, x], result[y + 1, x]
+        denominator = up - 2 * centre + down
+        if denominator < 0:
+            dy = 0.5 * (up - down) / denominator
+    return x + float(dx), y + float(dy)
+
+def detect_object_reduced(frame, template=None, detection_scale=DETECTION_SCALE, refine=DETECTION_REFINE):
+    """
+    detect_object on a frame downsampled by `detection_scale`, against a cached
+    template downscaled by the same factor. The sub-pixel peak is mapped back to
+    full-resolution coordinates. With `refine`, a small full-resolution window
+    around it is searched for the exact position and full-resolution score.
+    """
+    template = resolve_template(template)
     if template is None:
         return None
 
-    # Ensure the template is not larger than the frame
+    level = template.level(detection_scale)
+    reduced = reduce_frame(frame, detection_scale)
+    if (level.gray.shape[0] > reduced.shape[0] or level.gray.shape[1] > reduced.shape[1]
+            or min(level.gray.shape[:2]) < 4):
+        return match_best(FrameContext(frame), template)
+
+    result = match_template(FrameContext(reduced), template, level)
+    with profiler.stage('min_max_loc'):
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+
+    peak_x, peak_y = subpixel_peak(result, max_loc)
+    template_height, template_width = template.gray.shape[:2]
     frame_height, frame_width = frame.shape[:2]
-    template_height, template_width = template.shape[:2]
+    x = min(max(0, int(round(peak_x / detection_scale))), frame_width - template_width)
+    y = min(max(0, int(round(peak_y / detection_scale))), frame_height - template_height)
+
+    if refine:
+        margin = int(np.ceil(1 / detection_scale)) + 1
+        return detect_in_region(frame, template, (x, y, x + template_width, y + template_height), margin)
+
+    return ((x, y), (x + template_width, y + template_height), max_val)
+
+def search_window(frame_shape, box, margin, template_shape):
+    """
+    Window of the frame around `box` (x1, y1, x2, y2) grown by `margin`. Windows
+    that cross the frame edge are shifted back inside rather than clipped, so
+    repeated searches keep the same window size.
+    """
+    frame_height, frame_width = frame_shape[:2]
+    template_height, template_width = template_shape[:2]
+    x1, y1, x2, y2 = box
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+
+    width = min(frame_width, max(x2 - x1, template_width) + 2 * margin)
+    height = min(frame_height, max(y2 - y1, template_height) + 2 * margin)
+    x0 = min(max(0, x1 - margin), frame_width - width)
+    y0 = min(max(0, y1 - margin), frame_height - height)
+    return x0, y0, x0 + width, y0 + height
+
+def detect_in_region(frame, template, box, margin=0):
+    """
+    detect_object restricted to `box` plus `margin` pixels on each side.
+    The result is in full-frame coordinates.
+    """
+    template = resolve_template(template)
+    if template is None:
+        return None
+
+    x0, y0, x1, y1 = search_window(frame.shape, box, margin, template.gray.shape)
+    if template_backend(template) == 'features':
+        detection_result = feature_detection(frame[y0:y1, x0:x1], template)
+        if detection_result is None:
+            return None
+    else:
+        detection_result = match_best(FrameContext(frame[y0:y1, x0:x1]), template)
+    top_left, bottom_right = detection_result[:2]
+    return ((top_left[0] + x0, top_left[1] + y0), (bottom_right[0] + x0, bottom_right[1] + y0),
+            *detection_result[2:])
+
+def match_best(context, template):
+    """Best match of a compiled template in a frame."""
+    frame_gray = context.gray
+    level = template.scaled(1.0)
+    template_gray = level.gray
+
+    # Ensure the template is not larger than the frame
+    frame_height, frame_width = frame_gray.shape[:2]
+    template_height, template_width = template_gray.shape[:2]
 
     if template_height > frame_height or template_width > frame_width:
         # Resize template to fit within the frame
         scale = min(frame_height / template_height, frame_width / template_width)
         new_width = int(template_width * scale)
-        new_height = int(template_height * scale)
-        template = cv2.resize(template, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-    # Convert both to grayscale
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) == 3 else template
+        level = template.level(new_width / template_width)
+        template_gray = level.gray
 
     # Perform template matching
-    result = cv2.matchTemplate(frame_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    result = match_template(context, template, level)
+    with profiler.stage('min_max_loc'):
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
 
     # Get the best match location
     top_left = max_loc
@@ -38,101 +347,403 @@ def detect_object(frame, template=None):
 
     return (top_left, bottom_right, match_val)
 
-def multi_scale_detection(frame, threshold, scale_range=(0.5, 1.5), scale_steps=20):
-    template_data = load_template()
-    if template_data is None or len(template_data) != 2:
+def detect_many(frame, templates=None, threshold=None):
+    """
+    Match several templates against one frame. The grayscale frame is built
+    once and the per-template matches run on the shared thread pool.
+
+    `templates` is a list of CompiledTemplates or library names; None means the
+    whole template library. Returns a dict with per-template 'detections'
+    ((top_left, bottom_right, match_val) or None below `threshold`),
+    per-template 'timings' in seconds, and the frame 'setup_time' and 'total_time'.
+    """
+    start = time.perf_counter()
+
+    if templates is None:
+        templates = get_library()
+    templates = [get_template(t) if isinstance(t, str) else resolve_template(t) for t in templates]
+    templates = [t for t in templates if t is not None]
+
+    context = FrameContext(frame)
+    context.gray  # Convert once before fanning out to the workers
+    setup_time = time.perf_counter() - start
+
+    def match(template):
+        match_start = time.perf_counter()
+        if template_backend(template) == 'features':
+            detection_result = feature_detection(frame, template, context)
+        else:
+            detection_result = match_best(context, template)
+        if detection_result is not None and threshold is not None and detection_result[2] < threshold:
+            detection_result = None
+        return detection_result, time.perf_counter() - match_start
+
+    detections = {}
+    timings = {}
+    for template, (detection_result, elapsed) in zip(templates, get_executor().map(match, templates)):
+        detections[template.name] = detection_result
+        timings[template.name] = elapsed
+
+    return {
+        'detections': detections,
+        'timings': timings,
+        'setup_time': setup_time,
+        'total_time': time.perf_counter() - start,
+    }
+
+def scale_bound(context, template, level, downsample=SCALE_PRUNE_DOWNSAMPLE):
+    """
+    Best score of a template level against the downsampled frame, a cheap
+    estimate of its full-resolution best score. None if the level is too small
+    or too large to pre-match.
+    """
+    coarse = template.level(level.scale, downsample).gray
+    frame_small = context.downsampled(downsample)
+    if min(coarse.shape[:2]) < 4 or coarse.shape[0] > frame_small.shape[0] or coarse.shape[1] > frame_small.shape[1]:
         return None
-    template, _ = template_data
+    with profiler.stage('scale_bound'):
+        return cv2.minMaxLoc(cv2.matchTemplate(frame_small, coarse, cv2.TM_CCOEFF_NORMED))[1]
+
+def match_levels(context, template, levels, threshold, start_scale=None, good_enough=None, bound_slack=None):
+    """
+    Best match over some levels of a template. Returns (detection_result,
+    evaluated, pruned): (top_left, bottom_right, max_val, scale) or None below
+    `threshold`, and how many levels were matched and how many were skipped.
+
+    Pruning, all off by default:
+      start_scale - match the levels in order of distance from this scale
+      good_enough - stop at the first score at least this high
+      bound_slack - pre-match each level on the downsampled frame and skip it
+                    when that score plus `bound_slack` cannot reach the
+                    threshold or beat the best score so far
+    """
+    frame_gray = context.gray
+    if start_scale is not None:
+        levels = sorted(levels, key=lambda level: abs(level.scale - start_scale))
+
+    best_match = None
+    best_scale = 1.0
+    evaluated = 0
+    pruned = 0
+
+    for index, level in enumerate(levels):
+        scale = level.scale
+        resized_template = level.gray
+
+        if resized_template.shape[0] > frame_gray.shape[0] or resized_template.shape[1] > frame_gray.shape[1]:
+            continue
+
+        if bound_slack is not None:
+            bound = scale_bound(context, template, level)
+            if bound is not None and (bound + bound_slack < threshold or
+                                      (best_match is not None and bound + bound_slack <= best_match[2])):
+                pruned += 1
+                continue
+
+        result = match_template(context, template, level)
+        with profiler.stage('min_max_loc'):
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        evaluated += 1
 
+        if max_val >= threshold and (best_match is None or max_val > best_match[2]):
+            w, h = resized_template.shape[::-1]
+            best_match = (max_loc, (max_loc[0] + w, max_loc[1] + h), max_val)
+            best_scale = scale
+            if good_enough is not None and max_val >= good_enough:
+                pruned += len(levels) - index - 1
+                break
+
+    if best_match:
+        return (*best_match, best_scale), evaluated, pruned
+    else:
+        return None, evaluated, pruned
+
+def multi_scale_search(frame, threshold, scale_range=(0.5, 1.5), scale_steps=20, template=None,
+                       prune=SCALE_PRUNING, start_scale=None):
+    """
+    multi_scale_detection that also returns how many scales were matched and
+    how many were pruned. With `prune` the search starts at `start_scale` (e.g.
+    the last winning scale), stops at SCALE_GOOD_ENOUGH and skips scales whose
+    estimated upper bound cannot win, trading some recall for latency.
+    """
+    template = resolve_template(template)
+    if template is None:
+        return None, 0, 0
+
+    context = FrameContext(frame)
+    levels = template.pyramid(scale_range, scale_steps)
+    if not prune:
+        return match_levels(context, template, levels, threshold)
+    return match_levels(context, template, levels, threshold, start_scale, SCALE_GOOD_ENOUGH, SCALE_PRUNE_SLACK)
+
+def multi_scale_detection(frame, threshold, scale_range=(0.5, 1.5), scale_steps=20, template=None,
+                          prune=SCALE_PRUNING, start_scale=None):
+    return multi_scale_search(frame, threshold, scale_range, scale_steps, template, prune, start_scale)[0]
+
+def pyramid_multi_scale_detection(frame, threshold, scale_range=(0.5, 1.5), scale_steps=20,
+                                  pyramid_levels=PYRAMID_LEVELS, refine_candidates=PYRAMID_CANDIDATES,
+                                  template=None):
+    """
+    Coarse-to-fine variant of multi_scale_detection. All scales are matched
+    against a downsampled frame, and only the best few (scale, location)
+    candidates are refined in small full-resolution windows.
+    """
+    template = resolve_template(template)
     if template is None:
         return None
 
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) == 3 else template
+    context = FrameContext(frame)
+    frame_gray = context.gray
+    frame_height, frame_width = frame_gray.shape[:2]
+
+    factor = 2 ** pyramid_levels
+    if pyramid_levels <= 0 or frame_width // factor == 0 or frame_height // factor == 0:
+        return multi_scale_detection(frame, threshold, scale_range, scale_steps, template)
+    # The coarse frame gets its own context, so its score maps are cached like any other frame's
+    coarse_context = FrameContext(context.downsampled(factor))
+    coarse_gray = coarse_context.gray
+
+    levels = template.pyramid(scale_range, scale_steps)
+    coarse_levels = template.pyramid(scale_range, scale_steps, downsample=factor)
+
+    # Coarse pass: best location per scale on the downsampled frame
+    candidates = []
+    for index, coarse in enumerate(coarse_levels):
+        coarse_template = coarse.gray
+        if coarse_template.shape[0] < 4 or coarse_template.shape[1] < 4:
+            continue
+        if coarse_template.shape[0] > coarse_gray.shape[0] or coarse_template.shape[1] > coarse_gray.shape[1]:
+            continue
+
+        result = match_template(coarse_context, template, coarse)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        candidates.append((max_val, index, max_loc))
 
+    candidates.sort(reverse=True)
+
+    # Fine pass: search a small window around each candidate at full resolution
+    margin = 2 * factor
     best_match = None
     best_scale = 1.0
 
-    for scale in np.linspace(scale_range[0], scale_range[1], scale_steps):
-        resized_template = cv2.resize(template_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-        
-        if resized_template.shape[0] > frame.shape[0] or resized_template.shape[1] > frame.shape[1]:
+    for _, index, coarse_loc in candidates[:max(1, refine_candidates)]:
+        resized_template = levels[index].gray
+        h, w = resized_template.shape[:2]
+        if h > frame_height or w > frame_width:
             continue
 
-        result = cv2.matchTemplate(frame_gray, resized_template, cv2.TM_CCOEFF_NORMED)
+        x0 = min(max(0, coarse_loc[0] * factor - margin), frame_width - w)
+        y0 = min(max(0, coarse_loc[1] * factor - margin), frame_height - h)
+        x1 = min(frame_width, coarse_loc[0] * factor + w + margin)
+        y1 = min(frame_height, coarse_loc[1] * factor + h + margin)
+
+        window = frame_gray[y0:y1, x0:x1]
+        with profiler.stage('match_template'):
+            result = cv2.matchTemplate(window, resized_template, cv2.TM_CCOEFF_NORMED)
         _, max_val, _, max_loc = cv2.minMaxLoc(result)
 
         if max_val >= threshold and (best_match is None or max_val > best_match[2]):
-            w, h = resized_template.shape[::-1]
-            best_match = (max_loc, (max_loc[0] + w, max_loc[1] + h), max_val)
-            best_scale = scale
+            top_left = (x0 + max_loc[0], y0 + max_loc[1])
+            best_match = (top_left, (top_left[0] + w, top_left[1] + h), max_val)
+            best_scale = levels[index].scale
 
     if best_match:
         return (*best_match, best_scale)
     else:
         return None
 
-def detect_multiple_objects(frame, threshold, max_detections=5, non_max_suppression=True):
-    template_data = load_template()
-    if template_data is None or len(template_data) != 2:
+def rotation_banks(template, angle_range=ROTATION_RANGE, scale_range=ROTATION_SCALE_RANGE,
+                   scale_steps=ROTATION_SCALE_STEPS):
+    """
+    The (coarse, fine) rotation banks used by rotation_invariant_detection. Call
+    once after loading a template to build them before the first frame.
+    """
+    coarse = template.rotation_bank(angle_range, ROTATION_COARSE_STEP, scale_range, scale_steps,
+                                    max(1, ROTATION_DOWNSAMPLE))
+    # The fine bank has the coarse scales plus their midpoints
+    fine_steps = 2 * scale_steps - 1 if scale_steps > 1 else 1
+    fine = template.rotation_bank(angle_range, ROTATION_FINE_STEP, scale_range, fine_steps)
+    return coarse, fine
+
+def rotation_invariant_detection(frame, threshold, angle_range=ROTATION_RANGE, scale_range=ROTATION_SCALE_RANGE,
+                                 scale_steps=ROTATION_SCALE_STEPS, template=None):
+    """
+    Rotation- and scale-tolerant detection. Returns (top_left, bottom_right,
+    score, scale, angle), where the box bounds the rotated template and the
+    angle is in degrees counter-clockwise, or None below the threshold. With
+    a threshold of None the best match is returned whatever its score.
+
+    Coarse pass: every (angle, scale) of a coarse rotation bank is matched
+    against a downsampled frame. The templates have their corners filled with
+    their mean, so this pass can skip the (much slower) masked matching.
+    Fine pass: the best few candidates are re-matched with the masked templates
+    of a finer bank, over the neighbouring angles and scales and a small window
+    of the full-resolution frame. Both passes run on the shared thread pool.
+    Refinement: a part that lies between two bank angles or scales scores well
+    below an unrotated one, so the best match is then re-matched ROTATION_REFINE_ROUNDS
+    times with freshly rotated templates at half the previous angle and scale step
+    on either side, keeping the best.
+    """
+    template = resolve_template(template)
+    if template is None:
         return None
-    template, _ = template_data
 
+    context = FrameContext(frame)
+    frame_gray = context.gray
+    frame_height, frame_width = frame_gray.shape[:2]
+    factor = max(1, ROTATION_DOWNSAMPLE)
+    coarse_gray = context.downsampled(factor) if factor > 1 else frame_gray
+    executor = get_executor()
+
+    def coarse_match(entry):
+        h, w = entry.filled.shape[:2]
+        if h < 4 or w < 4 or h > coarse_gray.shape[0] or w > coarse_gray.shape[1]:
+            return None
+        result = cv2.matchTemplate(coarse_gray, entry.filled, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        # Centre of the match in full-resolution coordinates
+        center = ((max_loc[0] + w / 2) * factor, (max_loc[1] + h / 2) * factor)
+        return max_val, entry.angle, entry.scale, center
+
+    coarse_bank, fine_bank = rotation_banks(template, angle_range, scale_range, scale_steps)
+    with profiler.stage('rotation_coarse'):
+        candidates = [match for match in executor.map(coarse_match, coarse_bank) if match is not None]
+    candidates.sort(key=lambda match: match[0], reverse=True)
+
+    scale_spacing = (scale_range[1] - scale_range[0]) / (scale_steps - 1) if scale_steps > 1 else 0.0
+    # Neighbouring coarse candidates often point at the same spot; match each fine entry there once
+    jobs = []
+    centers = {}
+    for _, angle, scale, center in candidates[:max(1, ROTATION_CANDIDATES)]:
+        for index, entry in enumerate(fine_bank):
+            if (abs(entry.angle - angle) > ROTATION_COARSE_STEP / 2
+                    or abs(entry.scale - scale) > scale_spacing / 2 + 1e-9):
+                continue
+            seen = centers.setdefault(index, [])
+            if any(abs(cx - center[0]) + abs(cy - center[1]) <= 2 * factor for cx, cy in seen):
+                continue
+            seen.append(center)
+            jobs.append((entry, center))
+
+    def masked_match(gray, mask, scale, angle, center, margin):
+        h, w = gray.shape[:2]
+        if h > frame_height or w > frame_width:
+            return None
+        x1, y1 = int(round(center[0] - w / 2)), int(round(center[1] - h / 2))
+        x0, y0, x2, y2 = search_window(frame_gray.shape, (x1, y1, x1 + w, y1 + h), margin, (h, w))
+        result = cv2.matchTemplate(frame_gray[y0:y2, x0:x2], gray, cv2.TM_CCOEFF_NORMED, mask=mask)
+        # Masked scores are undefined on flat windows
+        cv2.patchNaNs(result, -1.0)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        top_left = (x0 + max_loc[0], y0 + max_loc[1])
+        return max_val, top_left, (top_left[0] + w, top_left[1] + h), scale, angle
+
+    def fine_match(job):
+        entry, center = job
+        return masked_match(entry.gray, entry.mask, entry.scale, entry.angle, center, 4 * factor)
+
+    with profiler.stage('rotation_fine'):
+        matches = [match for match in executor.map(fine_match, jobs) if match is not None]
+
+    if not matches:
+        return None
+    best = max(matches, key=lambda match: match[0])
+
+    def refine_match(step):
+        _, (x1, y1), (x2, y2), scale, angle = best
+        angle_step, scale_step = step
+        rotated, mask, _ = rotate_template(template.gray, angle + angle_step, scale + scale_step)
+        return masked_match(rotated, mask, scale + scale_step, angle + angle_step, ((x1 + x2) / 2, (y1 + y2) / 2), 2)
+
+    angle_step = ROTATION_FINE_STEP
+    scale_step = (scale_range[1] - scale_range[0]) / (2 * scale_steps - 2) if scale_steps > 1 else 0.0
+    with profiler.stage('rotation_refine'):
+        for _ in range(ROTATION_REFINE_ROUNDS):
+            if best[0] >= 1.0:
+                break
+            angle_step, scale_step = angle_step / 2, scale_step / 2
+            steps = [(-angle_step, 0.0), (angle_step, 0.0)]
+            if scale_step:
+                steps += [(0.0, -scale_step), (0.0, scale_step)]
+            refined = [match for match in executor.map(refine_match, steps) if match is not None]
+            best = max(refined + [best], key=lambda match: match[0])
+
+    max_val, top_left, bottom_right, scale, angle = best
+    if threshold is not None and max_val < threshold:
+        return None
+    return (top_left, bottom_right, max_val, scale, angle)
+
+def detect_multiple_objects(frame, threshold, max_detections=5, non_max_suppression=True, template=None):
+    template = resolve_template(template)
     if template is None:
         return None
 
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) == 3 else template
+    template_height, template_width = template.gray.shape[:2]
 
-    result = cv2.matchTemplate(frame_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-    locations = np.where(result >= threshold)
-    detections = list(zip(*locations[::-1]))
+    result = match_template(FrameContext(frame), template, template.scaled(1.0))
 
     if non_max_suppression:
-        detections = non_max_suppression_fast(detections, 0.3)
+        xs, ys, scores = find_peaks(result, threshold, (template_height, template_width))
+        boxes = np.stack([xs, ys, xs + template_width, ys + template_height], axis=1)
+        boxes, scores = non_max_suppression_fast(boxes, scores, 0.3, max_detections)
+    else:
+        ys, xs = np.nonzero(result >= threshold)
+        ys, xs = ys[:max_detections], xs[:max_detections]
+        boxes = np.stack([xs, ys, xs + template_width, ys + template_height], axis=1)
+        scores = result[ys, xs]
 
-    detections = detections[:max_detections]
-    
     results = []
-    for detection in detections:
-        top_left = detection
-        bottom_right = (top_left[0] + template_gray.shape[1], top_left[1] + template_gray.shape[0])
-        match_val = result[detection[1], detection[0]]
-        results.append((top_left, bottom_right, match_val))
+    for (x1, y1, x2, y2), match_val in zip(boxes.tolist(), scores.tolist()):
+        results.append(((x1, y1), (x2, y2), match_val))
 
     return results
 
-def non_max_suppression_fast(boxes, overlapThresh):
+def find_peaks(result, threshold, template_shape):
+    """
+    Reduce a score map to its local maxima above `threshold`.
+
+    A point is kept if it equals the maximum of its neighbourhood (a grey
+    dilation with a window of about half the template size), which collapses
+    the plateau of hits around each match to a single candidate.
+    Returns the x coordinates, y coordinates and scores of the peaks.
+    """
+    height, width = template_shape[:2]
+    kernel = np.ones((max(3, height // 2 | 1), max(3, width // 2 | 1)), np.uint8)
+    local_max = cv2.dilate(result, kernel)
+    ys, xs = np.nonzero((result >= threshold) & (result >= local_max))
+    return xs, ys, result[ys, xs]
+
+def non_max_suppression_fast(boxes, scores, overlapThresh, max_detections=None):
+    """
+    Greedy non-maximum suppression by score.
+
+    `boxes` is an (N, 4) array of (x1, y1, x2, y2) corners. Candidates are
+    sorted once by descending score; each kept box removes the remaining boxes
+    that overlap it by more than `overlapThresh` of their own area. Stops early
+    once `max_detections` boxes are kept. Returns the kept boxes and scores.
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    scores = np.asarray(scores)
     if len(boxes) == 0:
-        return []
-
-    boxes = np.array(boxes)
-    pick = []
+        return boxes.astype("int"), scores
 
-    x1 = boxes[:,0]
-    y1 = boxes[:,1]
-    x2 = boxes[:,0] + boxes[:,2]
-    y2 = boxes[:,1] + boxes[:,3]
+    x1, y1, x2, y2 = (boxes[:, i].astype(np.float64) for i in range(4))
+    area = (x2 - x1) * (y2 - y1)
 
-    area = (x2 - x1 + 1) * (y2 - y1 + 1)
-    idxs = np.argsort(y2)
+    remaining = np.argsort(scores, kind='stable')[::-1]
+    pick = []
 
-    while len(idxs) > 0:
-        last = len(idxs) - 1
-        i = idxs[last]
+    while remaining.size > 0:
+        i = remaining[0]
         pick.append(i)
+        if max_detections is not None and len(pick) >= max_detections:
+            break
 
-        xx1 = np.maximum(x1[i], x1[idxs[:last]])
-        yy1 = np.maximum(y1[i], y1[idxs[:last]])
-        xx2 = np.minimum(x2[i], x2[idxs[:last]])
-        yy2 = np.minimum(y2[i], y2[idxs[:last]])
-
-        w = np.maximum(0, xx2 - xx1 + 1)
-        h = np.maximum(0, yy2 - yy1 + 1)
-
-        overlap = (w * h) / area[idxs[:last]]
+        rest = remaining[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        overlap = (w * h) / np.maximum(area[rest], 1e-12)
 
-        idxs = np.delete(idxs, np.concatenate(([last],
-            np.where(overlap > overlapThresh)[0])))
+        remaining = rest[overlap <= overlapThresh]
 
-    return boxes[pick].astype("int")
+    return boxes[pick].astype("int"), scores[pick]
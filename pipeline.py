@@ -0,0 +1,80 @@
+# pipeline.py
+
+import threading
+import time
+from collections import deque
+
+
+class FrameQueue:
+    """
+    Bounded queue between pipeline stages. When it is full the oldest item
+    is dropped, so a slow consumer always works on the freshest frame.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None if the queue stays empty for `timeout` seconds."""
+        with self._cond:
+            if not self._items and not self._closed and timeout != 0:
+                self._cond.wait_for(lambda: self._items or self._closed, timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+            self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RateMeter:
+    """Rate and mean duration of events over a sliding time window."""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self._events = deque()
+
+    def tick(self, duration=0.0):
+        now = time.monotonic()
+        self.count += 1
+        self._events.append((now, duration))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+
+    @property
+    def rate(self):
+        self._trim(time.monotonic())
+        return len(self._events) / self.window
+
+    @property
+    def mean_duration(self):
+        events = list(self._events)
+        if not events:
+            return 0.0
+        return sum(duration for _, duration in events) / len(events)
@@ -0,0 +1,198 @@
+# profiling.py
+
+import bisect
+import json
+import threading
+import time
+
+from config import PROFILING_ENABLED, PROFILING_WINDOW
+
+# Histogram bucket upper bounds in seconds: 10 us to 10 s, 16 buckets per decade (~15% wide)
+BUCKETS = [1e-5 * 10 ** (i / 16) for i in range(97)]
+
+
+class RollingHistogram:
+    """
+    Latency histogram over roughly the last `window` seconds, in constant memory.
+    Two fixed-bucket histograms alternate: samples go into the current one and
+    the previous one is kept for one more window, then cleared and reused.
+    """
+
+    def __init__(self, window=PROFILING_WINDOW):
+        self.window = window
+        self.total_count = 0
+        self.total_time = 0.0
+        self._current = [0] * (len(BUCKETS) + 1)
+        self._previous = [0] * (len(BUCKETS) + 1)
+        self._current_sum = 0.0
+        self._previous_sum = 0.0
+        self._rotated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rotate(self, now):
+        elapsed = now - self._rotated
+        if elapsed < self.window:
+            return
+        if elapsed < 2 * self.window:
+            self._previous, self._current = self._current, self._previous
+            self._previous_sum = self._current_sum
+        else:
+            self._previous = [0] * len(self._previous)
+            self._previous_sum = 0.0
+        self._current[:] = [0] * len(self._current)
+        self._current_sum = 0.0
+        self._rotated = now
+
+    def record(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._rotate(now)
+            self._current[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self._current_sum += seconds
+            self.total_count += 1
+            self.total_time += seconds
+
+    def snapshot(self):
+        """Count, rate, mean and p50/p90/p99 (bucket upper bounds) in ms over the rolling window."""
+        now = time.monotonic()
+        with self._lock:
+            self._rotate(now)
+            counts = [a + b for a, b in zip(self._current, self._previous)]
+            total = self._current_sum + self._previous_sum
+            span = max(now - self._rotated + (self.window if any(self._previous) else 0), 1e-9)
+
+        count = sum(counts)
+        snapshot = {'count': count, 'rate': count / span, 'mean_ms': total / count * 1000 if count else 0.0,
+                    'total_count': self.total_count}
+        for name, fraction in (('p50_ms', 0.50), ('p90_ms', 0.90), ('p99_ms', 0.99)):
+            snapshot[name] = self._percentile(counts, count, fraction) * 1000
+        return snapshot
+
+    @staticmethod
+    def _percentile(counts, count, fraction):
+        if count == 0:
+            return 0.0
+        target = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                return BUCKETS[min(index, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+
+class _StageTimer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Profiler:
+    """
+    Named stage timers feeding rolling histograms. Cheap enough to leave on:
+    a timed stage costs two perf_counter calls and one bucket increment.
+
+        with profiler.stage('match_template'):
+            result = cv2.matchTemplate(...)
+    """
+
+    def __init__(self, enabled=PROFILING_ENABLED, window=PROFILING_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, RollingHistogram(self.window))
+        return histogram
+
+    def stage(self, name):
+        """Context manager timing one run of a stage."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self._histogram(name))
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self._histogram(name).record(seconds)
+
+    def stats(self):
+        return {name: histogram.snapshot() for name, histogram in list(self._histograms.items())}
+
+    def summary_lines(self, names=None):
+        """One short text line per stage, for the on-frame overlay."""
+        stats = self.stats()
+        lines = []
+        for name in names or sorted(stats):
+            stage = stats.get(name)
+            if stage and stage['count']:
+                lines.append(f"{name}: {stage['mean_ms']:.1f} ms (p99 {stage['p99_ms']:.1f}) {stage['rate']:.1f}/s")
+        return lines
+
+    def dump(self, path):
+        """Write the current stats to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump({'time': time.time(), 'stages': self.stats()}, f, indent=2)
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve the stats as JSON on http://host:port/metrics from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        # Imported here: http.server is slow to import and most runs never serve metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        profiler = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(profiler.stats()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self._server
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Shared profiler used by the detectors, the pipeline and the GUI
+profiler = Profiler()
@@ -0,0 +1,89 @@
+# score_cache.py
+
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from config import SCORE_CACHE_MB
+
+
+def frame_digest(image):
+    """
+    Fast content key of an image: CRC32 of its bytes plus its shape. A stalled
+    camera or a replay hands over byte-identical buffers, which map to the same key.
+    """
+    data = np.ascontiguousarray(image)
+    return zlib.crc32(memoryview(data).cast('B')), data.shape, data.dtype.str
+
+
+class ScoreCache:
+    """
+    Thread-safe LRU cache of raw score maps (matchTemplate output) bounded by
+    their total size in megabytes. Thresholds are applied after matching, so a
+    cached score map serves any threshold. Cached arrays are read-only.
+    """
+
+    def __init__(self, max_mb=SCORE_CACHE_MB):
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        if result.nbytes > self.max_bytes:
+            return result
+        result.flags.writeable = False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.nbytes
+            self._entries[key] = result
+            self.bytes += result.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+        return result
+
+    def resize(self, max_mb):
+        """Change the size limit; 0 turns the cache off."""
+        with self._lock:
+            self.max_bytes = int(max_mb * 2 ** 20)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'mb': self.bytes / 2 ** 20,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Shared cache used by match_template
+score_cache = ScoreCache()
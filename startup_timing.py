@@ -0,0 +1,53 @@
+# startup_timing.py
+"""
+Startup timing report. main.py imports this module first, so the clock starts
+before Qt, cv2 or the detectors are loaded; each startup step then calls
+mark(), and finish() prints the report once when startup is complete.
+
+    python main.py --startup-report
+"""
+
+import sys
+import threading
+import time
+
+_start = time.perf_counter()
+_marks = []
+_lock = threading.Lock()
+_reported = False
+
+# Set by main.py from STARTUP_REPORT or --startup-report
+enabled = False
+
+
+def mark(name):
+    """Record that a startup step finished, with the time since startup began."""
+    with _lock:
+        _marks.append((name, time.perf_counter() - _start, threading.current_thread().name))
+
+
+def marks():
+    with _lock:
+        return list(_marks)
+
+
+def report_lines():
+    lines = []
+    previous = 0.0
+    for name, elapsed, thread in sorted(marks(), key=lambda item: item[1]):
+        where = "" if thread == 'MainThread' else f" [{thread}]"
+        lines.append(f"{elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:6.1f})  {name}{where}")
+        previous = elapsed
+    return lines
+
+
+def finish():
+    """Print the report to stderr once, if enabled."""
+    global _reported
+    with _lock:
+        if not enabled or _reported:
+            return
+        _reported = True
+    print("Startup timing:", file=sys.stderr)
+    for line in report_lines():
+        print("  " + line, file=sys.stderr)
@@ -0,0 +1,295 @@
+# template_registry.py
+
+import itertools
+import os
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+
+from config import FEATURE_TEMPLATE_KEYPOINTS, FFT_SPECTRUM_CACHE
+from feature_matching import compute_features, create_matcher
+from fft_matching import template_spectrum
+from utils import (TEMPLATE_DIR, TEMPLATE_FILENAME, TEMPLATE_INFO_FILENAME, TEMPLATE_LIBRARY_DIR,
+                   list_library_templates)
+
+# One entry of a template's scale pyramid, ready to be handed to cv2.matchTemplate
+ScaledTemplate = namedtuple('ScaledTemplate', ['scale', 'gray', 'mean', 'norm'])
+
+# One entry of a template's rotation bank. `mask` is 255 inside the rotated template
+# and `filled` is the rotated template with the corners set to its mean, for fast unmasked matching.
+RotatedTemplate = namedtuple('RotatedTemplate', ['angle', 'scale', 'gray', 'mask', 'filled'])
+
+
+def template_statistics(gray):
+    """Return the mean and zero-mean L2 norm of a grayscale template."""
+    values = gray.astype(np.float64)
+    mean = float(values.mean())
+    norm = float(np.sqrt(((values - mean) ** 2).sum()))
+    return mean, norm
+
+
+def rotate_template(gray, angle, factor=1.0):
+    """
+    Resize a template by `factor`, then rotate it by `angle` degrees (counter-clockwise)
+    onto a canvas just large enough to hold it. Returns (rotated, mask, filled).
+    """
+    if factor != 1.0:
+        height, width = gray.shape[:2]
+        size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    height, width = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    canvas_width = max(1, int(np.ceil(width * cos + height * sin)))
+    canvas_height = max(1, int(np.ceil(width * sin + height * cos)))
+    matrix[0, 2] += (canvas_width - width) / 2
+    matrix[1, 2] += (canvas_height - height) / 2
+
+    rotated = cv2.warpAffine(gray, matrix, (canvas_width, canvas_height), flags=cv2.INTER_LINEAR)
+    mask = cv2.warpAffine(np.full_like(gray, 255), matrix, (canvas_width, canvas_height), flags=cv2.INTER_NEAREST)
+    # The rim is interpolated against the black border, so leave it out of the match
+    eroded = cv2.erode(mask, np.ones((3, 3), np.uint8))
+    if cv2.countNonZero(eroded) >= 16:
+        mask = eroded
+
+    filled = rotated.copy()
+    filled[mask == 0] = int(round(cv2.mean(rotated, mask)[0]))
+    return rotated, mask, filled
+
+
+# Unique per compiled template, so that a reloaded template never shares cache entries with the old one
+_template_ids = itertools.count()
+
+
+class CompiledTemplate:
+    """A template together with the forms the detectors match against."""
+
+    def __init__(self, name, image, roi_coords=None):
+        self.uid = next(_template_ids)
+        self.name = name
+        self.image = image
+        self.roi_coords = roi_coords
+        self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        self.mean, self.norm = template_statistics(self.gray)
+        self._pyramids = {}
+        self._levels = {}
+        self._rotation_banks = {}
+        self._features = None
+        self._matcher = None
+        self.match_lock = threading.Lock()
+        self._spectra = OrderedDict()
+        self._spectrum_size = None
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.gray.shape
+
+    def pyramid(self, scale_range=(0.5, 1.5), scale_steps=20, downsample=1):
+        """
+        Return the resized templates for a scale sweep, building them on first use.
+        With downsample > 1 the templates are shrunk by that extra factor for
+        matching against a downsampled frame; `scale` still holds the nominal scale.
+        """
+        key = (float(scale_range[0]), float(scale_range[1]), int(scale_steps), int(downsample))
+        levels = self._pyramids.get(key)
+        if levels is None:
+            with self._lock:
+                levels = self._pyramids.get(key)
+                if levels is None:
+                    levels = [self.scaled(scale, downsample)
+                              for scale in np.linspace(key[0], key[1], key[2])]
+                    self._pyramids[key] = levels
+        return levels
+
+    def level(self, scale, downsample=1):
+        """Cached ScaledTemplate for a single scale factor, e.g. a reduced detection scale."""
+        key = (float(scale), int(downsample))
+        level = self._levels.get(key)
+        if level is None:
+            with self._lock:
+                level = self._levels.get(key)
+                if level is None:
+                    level = self._levels[key] = self.scaled(*key)
+        return level
+
+    def scaled(self, scale, downsample=1):
+        """Return a single ScaledTemplate for the given scale factor."""
+        factor = scale / downsample
+        if factor == 1.0:
+            return ScaledTemplate(float(scale), self.gray, self.mean, self.norm)
+        height, width = self.gray.shape[:2]
+        size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+        gray = cv2.resize(self.gray, size, interpolation=cv2.INTER_AREA)
+        mean, norm = template_statistics(gray)
+        return ScaledTemplate(float(scale), gray, mean, norm)
+
+    def rotation_bank(self, angle_range, angle_step, scale_range, scale_steps, downsample=1):
+        """
+        Rotated and masked copies of the template for every (angle, scale) pair
+        of a sweep, built once per sweep and then reused for every frame.
+        """
+        key = (float(angle_range[0]), float(angle_range[1]), float(angle_step),
+               float(scale_range[0]), float(scale_range[1]), int(scale_steps), int(downsample))
+        bank = self._rotation_banks.get(key)
+        if bank is None:
+            with self._lock:
+                bank = self._rotation_banks.get(key)
+                if bank is None:
+                    angles = np.arange(key[0], key[1] + angle_step / 2, angle_step)
+                    scales = np.linspace(key[3], key[4], key[5])
+                    bank = []
+                    for scale in scales:
+                        for angle in angles:
+                            rotated, mask, filled = rotate_template(self.gray, angle, scale / downsample)
+                            bank.append(RotatedTemplate(float(angle), float(scale), rotated, mask, filled))
+                    self._rotation_banks[key] = bank
+        return bank
+
+    def features(self):
+        """ORB keypoints and descriptors of the template, computed on first use."""
+        if self._features is None:
+            with self._lock:
+                if self._features is None:
+                    self._features = compute_features(self.gray, FEATURE_TEMPLATE_KEYPOINTS)
+        return self._features
+
+    def matcher(self):
+        """Descriptor matcher trained on the template; use it under `match_lock`."""
+        if self._matcher is None:
+            features = self.features()
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = create_matcher(features.descriptors)
+        return self._matcher
+
+    def spectrum(self, level, size):
+        """
+        DFT of a pyramid level for the FFT backend. Each spectrum is as large as
+        the padded frame, so only the FFT_SPECTRUM_CACHE most recently used
+        levels are kept, for one frame size at a time.
+        """
+        key = (level.scale, level.gray.shape)
+        with self._lock:
+            if self._spectrum_size != size:
+                self._spectra = OrderedDict()
+                self._spectrum_size = size
+            spectrum = self._spectra.get(key)
+            if spectrum is None:
+                spectrum = self._spectra[key] = template_spectrum(level.gray, level.mean, size)
+                while len(self._spectra) > FFT_SPECTRUM_CACHE:
+                    self._spectra.popitem(last=False)
+            else:
+                self._spectra.move_to_end(key)
+            return spectrum
+
+
+class TemplateRegistry:
+    """
+    Keeps compiled templates in memory and reloads them only when the files
+    in the template directory change.
+
+    The unnamed default template is `templates/template.png`; named templates
+    live in the library directory as `<name>.png` plus `<name>.json`.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, library_dir=TEMPLATE_LIBRARY_DIR, check_interval=1.0):
+        self.template_dir = template_dir
+        self.library_dir = library_dir
+        self.check_interval = check_interval
+        self._entries = {}
+        self._library = None
+        self._lock = threading.Lock()
+
+    def _paths(self, name):
+        if name is None:
+            image_path = os.path.join(self.template_dir, TEMPLATE_FILENAME)
+            info_path = os.path.join(self.template_dir, TEMPLATE_INFO_FILENAME)
+        else:
+            image_path = os.path.join(self.library_dir, f"{name}.png")
+            info_path = os.path.join(self.library_dir, f"{name}.json")
+        return image_path, info_path
+
+    def _signature(self, name):
+        signature = []
+        for path in self._paths(name):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self, name):
+        image_path, info_path = self._paths(name)
+        image = cv2.imread(image_path)
+        if image is None:
+            return None
+        with open(info_path, 'r') as f:
+            template_info = json.load(f)
+        return CompiledTemplate(name or os.path.splitext(TEMPLATE_FILENAME)[0], image,
+                                template_info.get('roi_coords'))
+
+    def get(self, name=None):
+        """
+        Return the CompiledTemplate for `name` (the default template if None),
+        or None if it does not exist on disk.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now - entry['checked'] < self.check_interval:
+            return entry['template']
+
+        with self._lock:
+            signature = self._signature(name)
+            entry = self._entries.get(name)
+            if entry is not None and entry['signature'] == signature:
+                entry['checked'] = now
+                return entry['template']
+
+            template = self._load(name) if signature is not None else None
+            self._entries[name] = {'signature': signature, 'checked': now, 'template': template}
+            return template
+
+    def library(self):
+        """Return the compiled templates of every library entry."""
+        now = time.monotonic()
+        library = self._library
+        if library is None or now - library['checked'] >= self.check_interval:
+            try:
+                signature = os.stat(self.library_dir).st_mtime_ns
+            except OSError:
+                signature = None
+            if library is None or library['signature'] != signature:
+                names = list_library_templates(self.library_dir) if signature is not None else []
+                library = {'signature': signature, 'names': names}
+            library['checked'] = now
+            self._library = library
+
+        templates = [self.get(name) for name in library['names']]
+        return [template for template in templates if template is not None]
+
+    def invalidate(self, name=None):
+        """Force the next get() to re-check the files on disk."""
+        with self._lock:
+            self._entries.pop(name, None)
+            self._library = None
+
+
+# Shared registry used by the detectors and the GUI
+template_registry = TemplateRegistry()
+
+
+def get_template(name=None):
+    """Return the compiled template from the shared registry."""
+    return template_registry.get(name)
+
+
+def get_library():
+    """Return every compiled library template from the shared registry."""
+    return template_registry.library()
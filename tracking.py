@@ -0,0 +1,259 @@
+# tracking.py
+
+from collections import deque
+
+from config import (MATCH_THRESHOLD, SEARCH_MODE, ROI_MARGIN, TRACKING_MARGIN, TRACKING_MAX_MISSES,
+                    ADAPTIVE_SCALE_HISTORY, ADAPTIVE_SCALE_REFINE, ADAPTIVE_SCALE_MARGIN, ADAPTIVE_SCALE_MAX_MISSES,
+                    SCALE_PRUNING, SCALE_GOOD_ENOUGH, SCALE_PRUNE_SLACK)
+from object_detection import FrameContext, detect_object, detect_in_region, match_levels, resolve_template
+
+
+class TrackingDetector:
+    """
+    Stateful detector that limits where the template is searched.
+
+    Modes:
+      'full'     - scan the whole frame every time (same as detect_object)
+      'roi'      - scan only the template's saved ROI plus ROI_MARGIN
+      'tracking' - once found, scan a window of TRACKING_MARGIN around the last
+                   hit; go back to a full-frame scan after `max_misses`
+                   consecutive frames below the threshold
+    """
+
+    def __init__(self, template=None, threshold=MATCH_THRESHOLD, mode=SEARCH_MODE,
+                 roi_margin=ROI_MARGIN, tracking_margin=TRACKING_MARGIN, max_misses=TRACKING_MAX_MISSES):
+        self.template = template
+        self.threshold = threshold
+        self.mode = mode
+        self.roi_margin = roi_margin
+        self.tracking_margin = tracking_margin
+        self.max_misses = max_misses
+
+        self.last_box = None
+        self.misses = 0
+        self.full_scans = 0
+        self.window_scans = 0
+
+    def reset(self):
+        self.last_box = None
+        self.misses = 0
+
+    def detect(self, frame):
+        template = resolve_template(self.template)
+        if template is None:
+            return None
+
+        if self.mode == 'roi' and template.roi_coords:
+            self.window_scans += 1
+            return detect_in_region(frame, template, template.roi_coords, self.roi_margin)
+
+        if self.mode != 'tracking':
+            self.full_scans += 1
+            return detect_object(frame, template)
+
+        if self.last_box is not None:
+            self.window_scans += 1
+            detection_result = detect_in_region(frame, template, self.last_box, self.tracking_margin)
+        else:
+            self.full_scans += 1
+            detection_result = detect_object(frame, template)
+
+        self._track(detection_result)
+        return detection_result
+
+    def detect_region(self, frame, box):
+        """
+        Search only `box`, e.g. the tiles the motion gate saw change, keeping
+        the tracking state in step as detect() does. In 'roi' mode the box is
+        clipped to the saved ROI plus the ROI margin.
+        """
+        template = resolve_template(self.template)
+        if template is None:
+            return None
+
+        if self.mode == 'roi' and template.roi_coords:
+            x1, y1, x2, y2 = template.roi_coords
+            m = self.roi_margin
+            box = (max(box[0], x1 - m), max(box[1], y1 - m), min(box[2], x2 + m), min(box[3], y2 + m))
+            if box[0] >= box[2] or box[1] >= box[3]:
+                # The change lies outside the ROI
+                box, margin = template.roi_coords, self.roi_margin
+            else:
+                margin = 0
+            self.window_scans += 1
+            return detect_in_region(frame, template, box, margin)
+
+        self.window_scans += 1
+        detection_result = detect_in_region(frame, template, box)
+        if self.mode == 'tracking':
+            self._track(detection_result)
+        return detection_result
+
+    def _track(self, detection_result):
+        if detection_result is not None and detection_result[2] >= self.threshold:
+            top_left, bottom_right = detection_result[:2]
+            self.last_box = (*top_left, *bottom_right)
+            self.misses = 0
+        elif self.last_box is not None:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.reset()
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'full_scans': self.full_scans,
+            'window_scans': self.window_scans,
+            'tracking': self.last_box is not None,
+        }
+
+
+class AdaptiveScaleDetector:
+    """
+    Stateful multi_scale_detection that learns the part's apparent scale.
+
+    The first frames run the full `scale_range` sweep. Once the part has been
+    found, only a narrow band spanning the last `history` winning scales, plus
+    `margin` steps, is searched, on a grid `refine` times finer than the full
+    sweep. If the best scale lies on an edge of the band, the band is extended
+    past that edge in the same frame until the best scale is inside it, so a
+    part that keeps growing or shrinking is followed rather than lost. After
+    `max_misses` consecutive misses the full sweep is used again until the
+    part is found. With `prune` each search starts at the last winning scale
+    and is pruned as in multi_scale_search.
+
+    Returns the same (top_left, bottom_right, max_val, scale) as multi_scale_detection.
+    """
+
+    def __init__(self, template=None, threshold=MATCH_THRESHOLD, scale_range=(0.5, 1.5), scale_steps=20,
+                 history=ADAPTIVE_SCALE_HISTORY, refine=ADAPTIVE_SCALE_REFINE, margin=ADAPTIVE_SCALE_MARGIN,
+                 max_misses=ADAPTIVE_SCALE_MAX_MISSES, prune=SCALE_PRUNING):
+        self.template = template
+        self.threshold = threshold
+        self.scale_range = (float(scale_range[0]), float(scale_range[1]))
+        self.scale_steps = scale_steps
+        self.margin = margin
+        self.max_misses = max_misses
+        self.prune = prune
+
+        # Band scales are points of one fixed fine grid, so each is resized once and cached by the template
+        self.fine_step = (self.scale_range[1] - self.scale_range[0]) / max(1, (scale_steps - 1) * refine)
+        self.fine_points = (scale_steps - 1) * refine + 1
+
+        self.winners = deque(maxlen=history)
+        self.misses = 0
+        self.frames = 0
+        self.full_sweeps = 0
+        self.extensions = 0
+        self.scales_evaluated = 0
+        self.scales_pruned = 0
+        self.last_scales = 0
+
+    def reset(self):
+        self.winners.clear()
+        self.misses = 0
+
+    def grid_index(self, scale):
+        return int(round((scale - self.scale_range[0]) / self.fine_step))
+
+    def grid_scale(self, index):
+        return self.scale_range[0] + index * self.fine_step
+
+    def band(self):
+        """(first, last) fine-grid indices of the narrow search band, or None when the next frame needs the full sweep."""
+        if not self.winners or self.misses >= self.max_misses:
+            return None
+        indices = [self.grid_index(scale) for scale in self.winners]
+        return max(0, min(indices) - self.margin), min(self.fine_points - 1, max(indices) + self.margin)
+
+    def _beyond(self, template, edge, direction):
+        """
+        Fine-grid indices just past `edge` in `direction`, up to `margin` + 1
+        new template sizes. Neighbouring fine scales of a small template often
+        round to the same size, so those are stepped over.
+        """
+        indices, sizes = [], 0
+        size = template.level(self.grid_scale(edge)).gray.shape
+        index = edge + direction
+        while 0 <= index < self.fine_points:
+            level_size = template.level(self.grid_scale(index)).gray.shape
+            if level_size != size:
+                if sizes > self.margin:
+                    break
+                sizes += 1
+                size = level_size
+                indices.append(index)
+            index += direction
+        return indices
+
+    def _match(self, context, template, levels):
+        if self.prune:
+            start_scale = self.winners[-1] if self.winners else None
+            return match_levels(context, template, levels, self.threshold, start_scale,
+                                SCALE_GOOD_ENOUGH, SCALE_PRUNE_SLACK)
+        return match_levels(context, template, levels, self.threshold)
+
+    def detect(self, frame):
+        template = resolve_template(self.template)
+        if template is None:
+            return None
+
+        context = FrameContext(frame)
+        band = self.band()
+        if band is None:
+            self.full_sweeps += 1
+            detection_result, evaluated, pruned = self._match(
+                context, template, template.pyramid(self.scale_range, self.scale_steps))
+        else:
+            first, last = band
+            levels = [template.level(self.grid_scale(index)) for index in range(first, last + 1)]
+            detection_result, evaluated, pruned = self._match(context, template, levels)
+
+            # A best scale on the band edge may only be the nearest to a better one outside it
+            while detection_result is not None:
+                size = template.level(detection_result[3]).gray.shape
+                if first > 0 and size == template.level(self.grid_scale(first)).gray.shape:
+                    indices = self._beyond(template, first, -1)
+                elif last < self.fine_points - 1 and size == template.level(self.grid_scale(last)).gray.shape:
+                    indices = self._beyond(template, last, 1)
+                else:
+                    break
+                if not indices:
+                    break
+                first, last = min(first, indices[-1]), max(last, indices[-1])
+                self.extensions += 1
+                extra, extra_evaluated, extra_pruned = self._match(
+                    context, template, [template.level(self.grid_scale(index)) for index in indices])
+                evaluated += extra_evaluated
+                pruned += extra_pruned
+                if extra is None or extra[2] <= detection_result[2]:
+                    break
+                detection_result = extra
+
+        self.frames += 1
+        self.scales_evaluated += evaluated
+        self.scales_pruned += pruned
+        self.last_scales = evaluated
+
+        if detection_result is not None:
+            if band is None and self.misses >= self.max_misses:
+                # Found again after losing it: the old scales may no longer apply
+                self.winners.clear()
+            self.winners.append(detection_result[3])
+            self.misses = 0
+        elif self.winners:
+            self.misses += 1
+
+        return detection_result
+
+    def stats(self):
+        band = self.band()
+        return {
+            'frames': self.frames,
+            'full_sweeps': self.full_sweeps,
+            'extensions': self.extensions,
+            'scales_per_frame': self.scales_evaluated / self.frames if self.frames else 0.0,
+            'pruned_per_frame': self.scales_pruned / self.frames if self.frames else 0.0,
+            'last_scales': self.last_scales,
+            'band': (self.grid_scale(band[0]), self.grid_scale(band[1])) if band else None,
+        }
@@ -7,6 +7,7 @@ import numpy as np
 TEMPLATE_DIR = 'templates'
 TEMPLATE_FILENAME = 'template.png'
 TEMPLATE_INFO_FILENAME = 'template_info.json'
+TEMPLATE_LIBRARY_DIR = os.path.join(TEMPLATE_DIR, 'library')
 COUNT_FILE = 'object_count.json'
 
 def ensure_dir(directory):
@@ -29,6 +30,25 @@ def save_template(image, roi_coords):
     with open(info_path, 'w') as f:
         json.dump(template_info, f)
 
+def save_library_template(name, image, roi_coords=None):
+    """Save a named template into the multi-template library."""
+    ensure_dir(TEMPLATE_LIBRARY_DIR)
+    cv2.imwrite(os.path.join(TEMPLATE_LIBRARY_DIR, f"{name}.png"), image)
+
+    with open(os.path.join(TEMPLATE_LIBRARY_DIR, f"{name}.json"), 'w') as f:
+        json.dump({'roi_coords': roi_coords}, f)
+
+def list_library_templates(directory=TEMPLATE_LIBRARY_DIR):
+    """Return the names of all templates in the library, sorted."""
+    if not os.path.isdir(directory):
+        return []
+    names = []
+    for filename in os.listdir(directory):
+        name, ext = os.path.splitext(filename)
+        if ext == '.png' and os.path.exists(os.path.join(directory, f"{name}.json")):
+            names.append(name)
+    return sorted(names)
+
 def load_template():
     """Load the saved template image and ROI coordinates."""
     image_path = os.path.join(TEMPLATE_DIR, TEMPLATE_FILENAME)
@@ -15,15 +15,30 @@ def add_text(frame, text, position):
     """
     cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.9, BOUNDING_BOX_COLOR, 2)
 
-def visualize_result(frame, detection_result):
+def draw_overlay(frame, lines):
     """
-    Visualize the detection result on the frame.
+    Draw lines of small text in the bottom-left corner, e.g. performance stats.
+    """
+    height = frame.shape[0]
+    for index, line in enumerate(reversed(lines)):
+        cv2.putText(frame, line, (10, height - 10 - 20 * index), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    BOUNDING_BOX_COLOR, 1)
+
+def visualize_result(frame, detection_result, overlay_lines=None):
+    """
+    Visualize the detection result on the frame, with an optional text overlay.
     """
     if detection_result:
-        top_left, bottom_right, match_val = detection_result
+        top_left, bottom_right, match_val = detection_result[:3]
         draw_bounding_box(frame, top_left, bottom_right)
-        add_text(frame, f"Match: {match_val:.2f}", (10, 30))
+        text = f"Match: {match_val:.2f}"
+        if len(detection_result) > 4:
+            text += f"  Angle: {detection_result[4]:.0f}"
+        add_text(frame, text, (10, 30))
     else:
         add_text(frame, "No match found", (10, 30))
 
+    if overlay_lines:
+        draw_overlay(frame, overlay_lines)
+
     return frame